@@ -45,6 +45,7 @@ setup(
         "requests",
         "websockets",
     ],
+    extras_require={"fast": ["orjson"]},
     package_data={"undetected_chromedriver": ["*"]},
     url="https://github.com/ultrafunkamsterdam/undetected-chromedriver",
     license="GPL-3.0",
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+download_file against a local http server, standing in for google storage.
+
+    python -m unittest discover tests
+"""
+
+import base64
+import hashlib
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from undetected_chromedriver.repository import download_file
+
+
+PAYLOAD = bytes(range(256)) * 64
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # set per test
+    payload = PAYLOAD
+    md5 = None
+    refuse_ranges = False
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        data, status = self.payload, 200
+        range_header = self.headers.get("Range")
+        if range_header:
+            offset = int(range_header.split("=")[1].rstrip("-"))
+            if self.refuse_ranges or offset >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data, status = data[offset:], 206
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        md5 = self.md5 or hashlib.md5(self.payload).digest()
+        self.send_header(
+            "x-goog-hash", "crc32c=AAAAAA==,md5=%s" % base64.b64encode(md5).decode()
+        )
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadFileTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.url = "http://127.0.0.1:%d/chromedriver.zip" % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "chromedriver.zip")
+        Handler.md5 = None
+        Handler.refuse_ranges = False
+        Handler.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_part(self, data):
+        with open(self.path + ".part", "wb") as fh:
+            fh.write(data)
+
+    def read(self):
+        with open(self.path, "rb") as fh:
+            return fh.read()
+
+    def test_download(self):
+        progress = []
+        download_file(self.url, self.path, lambda *a: progress.append(a))
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertFalse(os.path.exists(self.path + ".part"))
+        self.assertEqual(progress[-1][:2], (len(PAYLOAD), len(PAYLOAD)))
+
+    def test_resume(self):
+        self.write_part(PAYLOAD[:1000])
+        download_file(self.url, self.path)
+        self.assertEqual(Handler.requests, ["bytes=1000-"])
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_range_not_satisfiable_restarts(self):
+        self.write_part(PAYLOAD[:1000])
+        Handler.refuse_ranges = True
+        download_file(self.url, self.path)
+        self.assertEqual(Handler.requests, ["bytes=1000-", None])
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_md5_mismatch(self):
+        Handler.md5 = hashlib.md5(b"something else").digest()
+        with self.assertRaises(IOError):
+            download_file(self.url, self.path)
+        self.assertFalse(os.path.exists(self.path))
+        # a corrupt partial file is not resumed
+        self.assertFalse(os.path.exists(self.path + ".part"))
+
+    def test_md5_mismatch_after_resume(self):
+        self.write_part(b"\xff" * 1000)
+        with self.assertRaises(IOError):
+            download_file(self.url, self.path)
+        self.assertFalse(os.path.exists(self.path + ".part"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Patcher.auto() against in-memory and on-disk repositories, without network i/o.
+
+    python -m unittest discover tests
+"""
+
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+
+from undetected_chromedriver import __main__ as cli
+from undetected_chromedriver import patcher
+from undetected_chromedriver.collector import DriverCollector
+from undetected_chromedriver.patcher import Patcher
+from undetected_chromedriver.repository import FileRepository
+from undetected_chromedriver.repository import HTTPRepository
+from undetected_chromedriver.repository import MemoryRepository
+
+
+VERSION = "120.0.6099.109"
+METADATA = "latest-versions-per-milestone-with-downloads.json"
+PACKAGE = "%s/linux64/chromedriver-linux64.zip" % VERSION
+
+# enough of a driver binary for the version scan and the patch
+DRIVER = (
+    b"\x7fELF"
+    + b"\x00" * 64
+    + b"platform_handle\x00content\x00"
+    + VERSION.encode()
+    + b"\x00" * 64
+    + b"{window.cdc_adoQpoasnfa76pfcZLmcfl_Array = window.Array || window.Array;}"
+    + b"\x00" * 64
+)
+
+
+def package():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("chromedriver-linux64/chromedriver", DRIVER)
+        zf.writestr("chromedriver-linux64/LICENSE.chromedriver", "license")
+    return buf.getvalue()
+
+
+def documents():
+    return {METADATA: json.dumps({"milestones": {"120": {"version": VERSION}}})}
+
+
+class PatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.previous_cache_dir = patcher._BASE_DRIVER_PATH
+        patcher.set_cache_dir(os.path.join(self.dir, "cache"))
+        # no background collections racing the assertions
+        DriverCollector._last_run = time.monotonic()
+        Patcher._metadata_parsed.clear()
+
+    def tearDown(self):
+        patcher.set_cache_dir(self.previous_cache_dir)
+        shutil.rmtree(self.dir)
+
+    def patcher(self, repository):
+        return Patcher(version_main=120, platform_name="linux64", repository=repository)
+
+    def assertInstance(self, p):
+        self.assertEqual(os.path.dirname(p.executable_path), patcher.INSTANCE_DRIVERS)
+        with open(p.executable_path, "rb") as fh:
+            data = fh.read()
+        self.assertIn(b"undetected chromedriver", data)
+        self.assertNotIn(b"window.cdc_", data)
+        self.assertEqual(p.parse_exe_version().vstring, VERSION)
+
+    def write_repository(self, root):
+        for path, data in [(METADATA, documents()[METADATA].encode()), (PACKAGE, package())]:
+            path = os.path.join(root, *path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as fh:
+                fh.write(data)
+
+    def test_auto_memory_repository(self):
+        repository = MemoryRepository(documents(), {PACKAGE: package()})
+        p = self.patcher(repository)
+        self.assertTrue(p.auto())
+        self.assertInstance(p)
+        self.assertEqual(repository.requests, ["/" + METADATA, PACKAGE])
+        self.assertEqual(Patcher.read_registry()["linux64_120"]["version"], VERSION)
+
+        # the registered driver is linked without asking the repository
+        second = self.patcher(repository)
+        self.assertTrue(second.auto())
+        self.assertInstance(second)
+        self.assertEqual(len(repository.requests), 2)
+        self.assertNotEqual(second.executable_path, p.executable_path)
+        self.assertEqual(
+            os.stat(second.executable_path).st_ino, os.stat(p.executable_path).st_ino
+        )
+
+    def test_auto_file_repository(self):
+        root = os.path.join(self.dir, "mirror")
+        self.write_repository(root)
+        p = self.patcher(FileRepository("file://" + root.replace(os.sep, "/")))
+        self.assertTrue(p.auto())
+        self.assertInstance(p)
+        self.assertEqual(os.listdir(patcher.PATCHED_DRIVERS), ["%s_linux64" % VERSION])
+
+    def test_auto_missing_package(self):
+        p = self.patcher(MemoryRepository(documents()))
+        with self.assertRaises(FileNotFoundError):
+            p.auto()
+        self.assertEqual(Patcher.read_registry(), {})
+
+    def test_provisioned_offline(self):
+        root = os.path.join(self.dir, "mirror")
+        self.write_repository(root)
+        argv = ["--milestone", "120", "--platform", "linux64"]
+        argv += ["--cache-dir", patcher._BASE_DRIVER_PATH, "--repository", root]
+        # keeps main() from configuring the root logger of the test run
+        null = logging.NullHandler()
+        logging.root.addHandler(null)
+        try:
+            with self.assertLogs("uc", "INFO") as logs:
+                self.assertEqual(cli.main(argv), 0)
+        finally:
+            logging.root.removeHandler(null)
+        self.assertIn("provisioned %s for linux64" % VERSION, logs.output[0])
+        with open(patcher.PROVISIONED, encoding="utf-8") as fh:
+            (entry,) = json.load(fh)["drivers"]
+        self.assertEqual((entry["milestone"], entry["patched"]), (120, True))
+
+        # nothing listens on port 9, any request would fail
+        p = self.patcher(HTTPRepository("http://127.0.0.1:9"))
+        self.assertTrue(p.auto())
+        self.assertInstance(p)
+        self.assertEqual(
+            os.stat(p.executable_path).st_ino,
+            os.stat(os.path.join(patcher._BASE_DRIVER_PATH, entry["path"])).st_ino,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+HTTPRepository's metadata cache against a local http server: the ttl, and
+revalidation using ETag.
+
+    python -m unittest discover tests
+"""
+
+import http.server
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from undetected_chromedriver.repository import HTTPRepository
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # set per test
+    body = b"{}"
+    etag = '"1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPRepositoryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.url = "http://127.0.0.1:%d" % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        Handler.body = b'{"version": 1}'
+        Handler.etag = '"1"'
+        Handler.requests = []
+        self.repository = HTTPRepository(self.url, cache_dir=self.dir)
+        self.repository.metadata_stale_while_revalidate = False
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def get(self):
+        return json.loads(self.repository.get_document("/metadata.json"))
+
+    def cache_entry(self):
+        (name,) = os.listdir(self.dir)
+        with open(os.path.join(self.dir, name), encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def test_fresh_entry_is_not_revalidated(self):
+        self.assertEqual(self.get(), {"version": 1})
+        self.assertEqual(self.get(), {"version": 1})
+        self.assertEqual(Handler.requests, [None])
+
+    def test_stale_entry_not_modified(self):
+        self.get()
+        self.repository.metadata_ttl = 0
+        fetched = self.cache_entry()["fetched"]
+        self.assertEqual(self.get(), {"version": 1})
+        self.assertEqual(Handler.requests, [None, '"1"'])
+        # a 304 makes the entry fresh again
+        self.assertGreater(self.cache_entry()["fetched"], fetched)
+
+    def test_stale_entry_modified(self):
+        self.get()
+        self.repository.metadata_ttl = 0
+        Handler.body, Handler.etag = b'{"version": 2}', '"2"'
+        self.assertEqual(self.get(), {"version": 2})
+        self.assertEqual(Handler.requests, [None, '"1"'])
+        self.assertEqual(self.cache_entry()["etag"], '"2"')
+
+    def test_stale_while_revalidate(self):
+        self.get()
+        self.repository.metadata_ttl = 0
+        self.repository.metadata_stale_while_revalidate = True
+        Handler.body, Handler.etag = b'{"version": 2}', '"2"'
+        # the stale body is returned right away, the new one cached in the background
+        self.assertEqual(self.get(), {"version": 1})
+        deadline = time.monotonic() + 5
+        while self.cache_entry()["etag"] != '"2"' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.cache_entry()["etag"], '"2"')
+        self.assertEqual(Handler.requests, [None, '"1"'])
+
+    def test_unreachable_uses_stale_entry(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        repository = HTTPRepository(
+            "http://127.0.0.1:%d" % server.server_port, cache_dir=self.dir
+        )
+        repository.metadata_stale_while_revalidate = False
+        repository.get_document("/metadata.json")
+        server.shutdown()
+        server.server_close()
+        repository.metadata_ttl = 0
+        with self.assertLogs("undetected_chromedriver.repository", "WARNING"):
+            body = repository.get_document("/metadata.json")
+        self.assertEqual(json.loads(body), {"version": 1})
+
+    def test_unreachable_without_entry(self):
+        # nothing listens on port 9
+        repository = HTTPRepository("http://127.0.0.1:9", cache_dir=self.dir)
+        with self.assertRaises(OSError):
+            repository.get_document("/metadata.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
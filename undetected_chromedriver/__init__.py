@@ -19,41 +19,60 @@ from __future__ import annotations
 
 __version__ = "3.5.5"
 
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import os
 import pathlib
 import re
-import shutil
 import subprocess
-import sys
 import tempfile
 import time
 from weakref import finalize
 
 import selenium.webdriver.chrome.service
 import selenium.webdriver.chrome.webdriver
-from selenium.webdriver.common.by import By
 import selenium.webdriver.chromium.service
 import selenium.webdriver.remote.command
 import selenium.webdriver.remote.webdriver
 
+from .asyncchrome import AsyncChrome
+from .capture import ResponseCapture
 from .cdp import CDP
+from . import discovery
+from .discovery import browser_version
 from .dprocess import start_detached
 from .options import ChromeOptions
 from .patcher import IS_POSIX
 from .patcher import Patcher
+from . import ports
+from .pool import BrowserPool
+from .profiles import ProfileTemplate
+from . import readiness
 from .reactor import Reactor
+from .reactor import ReactorHub
+from .teardown import TeardownService
+from .teardown import reap_pid
+from .teardown import reap_process
+from .teardown import remove_tree
+from .timing import StartupProfile
 from .webelement import UCWebElement
 from .webelement import WebElement
 import pickle
 
 __all__ = (
     "Chrome",
+    "AsyncChrome",
     "ChromeOptions",
     "Patcher",
     "Reactor",
+    "ReactorHub",
+    "ResponseCapture",
     "CDP",
+    "BrowserPool",
+    "ProfileTemplate",
+    "StartupProfile",
+    "TeardownService",
     "find_chrome_executable",
 )
 
@@ -126,6 +145,8 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
         no_sandbox=True,
         user_multi_procs: bool = False,
         instance_id=None,
+        profile_template=False,
+        startup_sink=None,
         **kw,
     ):
         """
@@ -165,6 +186,13 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                 driver.add_cdp_listener("Network.dataReceived", yourcallback)
                 # yourcallback is an callable which accepts exactly 1 dict as parameter
 
+                # a slow handler can get its own limits, see Reactor.add_event_handler
+                driver.add_cdp_listener("Network.dataReceived", yourcallback,
+                                        max_queue=100, overflow="drop_oldest")
+
+            the events of all drivers in a process are handled on a shared event loop,
+            set $UC_REACTOR_LOOPS (or ReactorHub.default().size) to use more of them.
+
 
         service_args: list of str, optional, default: None
             arguments to pass to the driver service
@@ -202,6 +230,8 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
             if you, for god knows whatever reason, use
             an older version of Chrome. You can specify it's full rounded version number
             here. Example: 87 for all versions of 87
+            by default, the version of the browser executable is detected, and a driver
+            matching it is used. drivers for several versions are kept side by side.
 
         patcher_force_close: bool, optional, default: False
             instructs the patcher to do whatever it can to access the chromedriver binary
@@ -244,21 +274,47 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
             for this to work. YOU MUST HAVE AT LEAST 1 UNDETECTED_CHROMEDRIVER BINARY IN YOUR ROAMING DATA FOLDER.
             this requirement can be easily satisfied, by just running this program "normal" and close/kill it.
 
+        profile_template: bool, optional, default: False
+            only used when no user_data_dir is given.
+            instead of letting chrome initialize an empty temporary profile on every start,
+            clone it from a template profile which is built once per browser version and prefs.
+            the prefs set on the options are written into the template.
+
+        startup_sink: callable or str, optional, default: None ($UC_STARTUP_LOG)
+            the timed phases of the startup are kept in driver.startup_profile.
+            when the startup is done, the profile is passed to startup_sink if it is a callable,
+            or appended as a json line to the file startup_sink points to.
+
 
         """
 
         finalize(self, self._ensure_close, self)
         self.debug = debug
+        self.startup_profile = StartupProfile(sink=startup_sink)
+        browser_executable_path = (
+            browser_executable_path
+            or getattr(options, "binary_location", None)
+            or find_chrome_executable()
+        )
         self.patcher = Patcher(
             executable_path=driver_executable_path,
             force=patcher_force_close,
             version_main=version_main,
             user_multi_procs=user_multi_procs,
+            browser_executable_path=browser_executable_path,
+        )
+        self.patcher.startup_profile = self.startup_profile
+        # the driver is provisioned in the background, while the profile is
+        # prepared and the browser is starting. both are joined before the
+        # session is created.
+        provisioning = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="uc-patcher"
         )
-        # self.patcher.auto(user_multiprocess = user_multi_num_procs)
-        self.patcher.auto()
+        patcher_future = provisioning.submit(self._provision_driver)
+        provisioning.shutdown(wait=False)
 
         # self.patcher = patcher
+        profile_start = time.perf_counter()
         if not options:
             options = ChromeOptions()
 
@@ -272,23 +328,25 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
             pass
 
         options._session = self
+        # ports reserved from the PortAllocator, released after quit()
+        self.reserved_ports = []
 
         if not options.debugger_address:
-            debug_port = (
-                port
-                if port != 0
-                else selenium.webdriver.common.service.utils.free_port()
-            )
             debug_host = "127.0.0.1"
+            if port != 0:
+                debug_port = port
+            else:
+                debug_port = ports.allocator.reserve(debug_host)
+                self.reserved_ports.append(debug_port)
             options.debugger_address = "%s:%d" % (debug_host, debug_port)
         else:
             debug_host, debug_port = options.debugger_address.split(":")
             debug_port = int(debug_port)
 
         if enable_cdp_events:
-            options.set_capability(
-                "goog:loggingPrefs", {"performance": "ALL", "browser": "ALL"}
-            )
+            # events are pushed to the Reactor over devtools, so no
+            # performance log has to be buffered by chromedriver
+            options.set_capability("goog:loggingPrefs", {"browser": "ALL"})
 
         options.add_argument("--remote-debugging-host=%s" % debug_host)
         options.add_argument("--remote-debugging-port=%s" % debug_port)
@@ -347,6 +405,28 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                     "user_data_dir property found in options object: %s" % user_data_dir
                 )
 
+            elif profile_template:
+                prefs = options.experimental_options.get("prefs")
+                try:
+                    template = ProfileTemplate(browser_executable_path, prefs=prefs)
+                    user_data_dir = template.clone()
+                except Exception as e:
+                    logger.warning(
+                        "could not clone the profile template, using an empty profile: %s"
+                        % e
+                    )
+                    user_data_dir = os.path.normpath(tempfile.mkdtemp())
+                else:
+                    if prefs:
+                        # these are already in the template
+                        del options._experimental_options["prefs"]
+                    logger.debug(
+                        "cloned profile template %s to %s" % (template.path, user_data_dir)
+                    )
+                keep_user_data_dir = False
+                arg = "--user-data-dir=%s" % user_data_dir
+                options.add_argument(arg)
+
             else:
                 user_data_dir = os.path.normpath(tempfile.mkdtemp())
                 keep_user_data_dir = False
@@ -370,9 +450,7 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
         options.add_argument("--lang=%s" % language)
 
         if not options.binary_location:
-            options.binary_location = (
-                browser_executable_path or find_chrome_executable()
-            )
+            options.binary_location = browser_executable_path
 
         if not options.binary_location or not \
                 pathlib.Path(options.binary_location).exists():
@@ -386,8 +464,6 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                     .format("/path/to/browser/executable" if IS_POSIX else "c:/path/to/your/browser.exe")
                 )
 
-        self._delay = 3
-
         self.user_data_dir = user_data_dir
         self.keep_user_data_dir = keep_user_data_dir
 
@@ -398,7 +474,11 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
 
         if headless or getattr(options, 'headless', None):
             #workaround until a better checking is found
+            # version_main is detected from the browser, as the patcher
+            # may still be running at this point
             try:
+                if not self.patcher.version_main:
+                    raise ValueError("version_main unknown")
                 if self.patcher.version_main < 108:
                     options.add_argument("--headless=chrome")
                 elif self.patcher.version_main >= 108:
@@ -419,6 +499,9 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
             or divmod(logging.getLogger().getEffectiveLevel(), 10)[0]
         )
 
+        self.startup_profile.add("profile_setup", profile_start)
+        prefs_start = time.perf_counter()
+
         if hasattr(options, "handle_prefs"):
             options.handle_prefs(user_data_dir)
 
@@ -433,19 +516,22 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                 if config["profile"]["exit_type"] is not None:
                     # fixing the restore-tabs-nag
                     config["profile"]["exit_type"] = None
-                fs.seek(0, 0)
-                json.dump(config, fs)
-                fs.truncate()  # the file might be shorter
-                logger.debug("fixed exit_type flag")
+                    fs.seek(0, 0)
+                    json.dump(config, fs)
+                    fs.truncate()  # the file might be shorter
+                    logger.debug("fixed exit_type flag")
         except Exception as e:
             logger.debug("did not find a bad exit_type flag ")
 
+        self.startup_profile.add("prefs_write", prefs_start)
         self.options = options
 
         if not desired_capabilities:
             desired_capabilities = options.to_capabilities()
 
+        spawn_start = time.perf_counter()
         if not use_subprocess:
+            self.browser_process = None
             self.browser_pid = start_detached(
                 options.binary_location, *options.arguments
             )
@@ -457,11 +543,25 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                 stderr=subprocess.PIPE,
                 close_fds=IS_POSIX,
             )
+            self.browser_process = browser
             self.browser_pid = browser.pid
+        self.startup_profile.add("browser_spawn", spawn_start)
 
-
+        try:
+            with self.startup_profile.span("driver_wait"):
+                patcher_future.result()
+            with self.startup_profile.span("devtools_ready"):
+                self._wait_ready(chromedriver=False)
+        except BaseException:
+            # do not leave the browser (and its profile) behind
+            self.quit()
+            raise
+
+        self._service_start = time.perf_counter()
+        service_port = ports.allocator.reserve()
+        self.reserved_ports.append(service_port)
         service = selenium.webdriver.chromium.service.ChromiumService(
-            self.patcher.executable_path
+            self.patcher.executable_path, port=service_port
         )
         self.pickled_options = pickle.dumps(options)
         # pickle.dump(options, open(f"options_{instance_id}.pickle", "wb"))
@@ -470,6 +570,11 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
             options=options,
             keep_alive=keep_alive,
         )
+        self.startup_profile.finish(
+            browser_version=browser_version(options.binary_location),
+            driver_version=str(self.patcher.version_full or ""),
+            platform=self.patcher.platform_name,
+        )
 
         self.reactor = None
 
@@ -490,6 +595,29 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
         if headless or getattr(options, 'headless', None):
             self._configure_headless()
 
+    def _provision_driver(self):
+        """
+        Runs the patcher. Called from a worker thread during startup.
+        """
+        with self.startup_profile.span("driver"):
+            return self.patcher.auto()
+
+    def _wait_ready(self, timeout=readiness.DEFAULT_TIMEOUT, chromedriver=True):
+        """
+        Waits until the browser devtools, and chromedriver, respond.
+        Gives up silently after timeout seconds, leaving the error to the
+        first command which needs them.
+        """
+        host, port = self.options.debugger_address.split(":")
+        try:
+            readiness.wait_for_devtools(host, port, timeout=timeout)
+            if chromedriver:
+                readiness.wait_for_chromedriver(
+                    self.service.service_url, timeout=timeout
+                )
+        except TimeoutError as e:
+            logger.debug(e)
+
     def _configure_headless(self):
         orig_get = self.get
         logger.info("setting properties for headless")
@@ -666,16 +794,37 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
         #     self._hook_remove_cdc_props()
         return super().get(url)
 
-    def add_cdp_listener(self, event_name, callback):
+    def add_cdp_listener(self, event_name, callback, **options):
         if (
             self.reactor
             and self.reactor is not None
             and isinstance(self.reactor, Reactor)
         ):
-            self.reactor.add_event_handler(event_name, callback)
+            self.reactor.add_event_handler(event_name, callback, **options)
             return self.reactor.handlers
         return False
 
+    def capture_response_bodies(self, **options):
+        """
+        Captures the bodies of the pages' responses, streamed as they arrive.
+        Requires enable_cdp_events=True.
+
+        Args:
+            options: see capture.ResponseCapture
+                     (urls, mime_types, resource_types, directory, on_chunk,
+                     on_complete, max_body_size, ...)
+
+        Returns:
+            the ResponseCapture, its .completed holds the last captured bodies
+        """
+        if not isinstance(self.reactor, Reactor):
+            raise RuntimeError(
+                "capturing response bodies requires Chrome(enable_cdp_events=True)"
+            )
+        capture = ResponseCapture(**options)
+        self.reactor.add_capture(capture)
+        return capture
+
     def clear_cdp_listeners(self):
         if self.reactor and isinstance(self.reactor, Reactor):
             self.reactor.handlers.clear()
@@ -704,16 +853,22 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
             cdp = CDP(self.options)
             cdp.tab_new(url)
 
-    def reconnect(self, timeout=0.1):
+    def reconnect(self, timeout=readiness.DEFAULT_TIMEOUT):
+        """
+        Restarts chromedriver and creates a new session with the running browser.
+
+        Args:
+            timeout: seconds to wait at most for chromedriver and the browser to be ready
+        """
         try:
             self.service.stop()
         except Exception as e:
             logger.debug(e)
-        time.sleep(timeout)
         try:
             self.service.start()
         except Exception as e:
             logger.debug(e)
+        self._wait_ready(timeout)
 
         try:
             self.start_session()
@@ -723,9 +878,18 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
     def start_session(self, capabilities=None, browser_profile=None):
         if not capabilities:
             capabilities = self.options.to_capabilities()
-        super(selenium.webdriver.chrome.webdriver.WebDriver, self).start_session(
-            capabilities
-        )
+        profile = getattr(self, "startup_profile", None)
+        if profile is None or profile.finished:
+            super(selenium.webdriver.chrome.webdriver.WebDriver, self).start_session(
+                capabilities
+            )
+            return
+        # called by the WebDriver constructor, once the service is up
+        profile.add("chromedriver_ready", self._service_start)
+        with profile.span("session_created"):
+            super(selenium.webdriver.chrome.webdriver.WebDriver, self).start_session(
+                capabilities
+            )
         # super(Chrome, self).start_session(capabilities, browser_profile)
 
     def find_elements_recursive(self, by, value):
@@ -764,40 +928,49 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                 yield elem
 
     def quit(self):
+        """
+        Stops chromedriver and the browser.
+
+        This only signals the processes. Waiting for them to exit and removing
+        the temporary profile is done in the background by the TeardownService,
+        use TeardownService.default().flush() to wait for it.
+        """
+        teardown = TeardownService.default()
+        submit = not getattr(self, "_teardown_submitted", False)
+        self._teardown_submitted = True
         try:
             self.service.process.kill()
             logger.debug("webdriver process ended")
+            if submit:
+                teardown.submit(reap_process, self.service.process)
         except (AttributeError, RuntimeError, OSError):
             pass
         try:
-            self.reactor.event.set()
+            self.reactor.stop()
             logger.debug("shutting down reactor")
         except AttributeError:
             pass
         try:
             os.kill(self.browser_pid, 15)
             logger.debug("gracefully closed browser")
+            if submit:
+                if getattr(self, "browser_process", None):
+                    teardown.submit(reap_process, self.browser_process)
+                else:
+                    teardown.submit(reap_pid, self.browser_pid)
         except Exception as e:  # noqa
             pass
         if (
-            hasattr(self, "keep_user_data_dir")
+            submit
+            and hasattr(self, "keep_user_data_dir")
             and hasattr(self, "user_data_dir")
             and not self.keep_user_data_dir
         ):
-            for _ in range(5):
-                try:
-                    shutil.rmtree(self.user_data_dir, ignore_errors=False)
-                except FileNotFoundError:
-                    pass
-                except (RuntimeError, OSError, PermissionError) as e:
-                    logger.debug(
-                        "When removing the temp profile, a %s occured: %s\nretrying..."
-                        % (e.__class__.__name__, e)
-                    )
-                else:
-                    logger.debug("successfully removed %s" % self.user_data_dir)
-                    break
-                time.sleep(0.1)
+            # queued after the browser, so it has released the files
+            teardown.submit(remove_tree, self.user_data_dir)
+        if submit:
+            for reserved_port in getattr(self, "reserved_ports", ()):
+                teardown.submit(ports.allocator.release, reserved_port)
 
         # dereference patcher, so patcher can start cleaning up as well.
         # this must come last, otherwise it will throw 'in use' errors
@@ -827,8 +1000,8 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.service.stop()
-        time.sleep(self._delay)
         self.service.start()
+        self._wait_ready()
         self.start_session()
 
     def __hash__(self):
@@ -866,36 +1039,4 @@ def find_chrome_executable():
         the full file path to found executable
 
     """
-    candidates = set()
-    if IS_POSIX:
-        for item in os.environ.get("PATH").split(os.pathsep):
-            for subitem in (
-                "google-chrome",
-                "chromium",
-                "chromium-browser",
-                "chrome",
-                "google-chrome-stable",
-            ):
-                candidates.add(os.sep.join((item, subitem)))
-        if "darwin" in sys.platform:
-            candidates.update(
-                [
-                    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-                    "/Applications/Chromium.app/Contents/MacOS/Chromium",
-                ]
-            )
-    else:
-        for item in map(
-            os.environ.get,
-            ("PROGRAMFILES", "PROGRAMFILES(X86)", "LOCALAPPDATA", "PROGRAMW6432"),
-        ):
-            if item is not None:
-                for subitem in (
-                    "Google/Chrome/Application",
-                ):
-                    candidates.add(os.sep.join((item, subitem, "chrome.exe")))
-    for candidate in candidates:
-        logger.debug('checking if %s exists and is executable' % candidate)
-        if os.path.exists(candidate) and os.access(candidate, os.X_OK):
-            logger.debug('found! using %s' % candidate)
-            return os.path.normpath(candidate)
+    return discovery.find_chrome_executable()
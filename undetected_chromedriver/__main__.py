@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Pre-bakes patched drivers, for example into container images.
+
+    python -m undetected_chromedriver --milestone 120 121 --platform linux64 --cache-dir /opt/ucdriver
+
+Run with UC_DRIVER_CACHE=/opt/ucdriver, Patcher.auto() then uses these drivers
+without any network i/o or patching.
+"""
+
+import argparse
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+from . import patcher
+from .locking import FileLock
+from .patcher import Patcher
+from .repository import repository_from_urls
+
+
+logger = logging.getLogger("uc")
+
+
+def provision(milestone, platform_name, repository=None):
+    p = Patcher(
+        version_main=milestone, platform_name=platform_name, repository=repository
+    )
+    return p.provision()
+
+
+def write_manifest(entries):
+    """
+    Merges entries into the provisioned manifest of the current cache dir.
+    """
+    with FileLock(patcher.PROVISION_LOCK):
+        try:
+            with io.open(patcher.PROVISIONED, "r", encoding="utf-8") as fh:
+                drivers = json.load(fh)["drivers"]
+        except (OSError, ValueError, KeyError):
+            drivers = []
+        by_key = {(d["milestone"], d["platform"]): d for d in drivers + entries}
+        drivers = sorted(by_key.values(), key=lambda d: (d["platform"], d["milestone"]))
+        tmp_path = patcher.PROVISIONED + ".tmp"
+        with io.open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"created": time.time(), "drivers": drivers}, fh, indent=2)
+        os.replace(tmp_path, patcher.PROVISIONED)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m undetected_chromedriver",
+        description="download, patch and verify chromedriver binaries into a cache folder",
+    )
+    parser.add_argument(
+        "-m",
+        "--milestone",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="major chrome versions, ex: 120 121 (default: latest stable)",
+    )
+    parser.add_argument(
+        "-p",
+        "--platform",
+        nargs="+",
+        default=[Patcher().platform_name],
+        help="driver platforms, ex: linux64 mac-x64 mac-arm64 win32 win64 (default: this one)",
+    )
+    parser.add_argument(
+        "-d",
+        "--cache-dir",
+        default=os.environ.get("UC_DRIVER_CACHE"),
+        help="target folder, use it at runtime through UC_DRIVER_CACHE (default: $UC_DRIVER_CACHE or ./.ucdriver)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repository",
+        nargs="+",
+        default=None,
+        help="mirror urls or folders (http://, https://, file://) to fetch from, "
+        "tried in order (default: $UC_DRIVER_REPOSITORY or google)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=4, help="parallel downloads (default: 4)"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(level=level)
+    # importing the package pinned "uc" to the root level at import time
+    logger.setLevel(level)
+    if args.cache_dir:
+        patcher.set_cache_dir(args.cache_dir)
+
+    repository = None
+    if args.repository:
+        repository = repository_from_urls(
+            args.repository, os.path.join(Patcher.data_path, "metadata")
+        )
+
+    jobs = [(m, p, repository) for m in args.milestone for p in args.platform]
+    entries, failed = [], 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(provision, *job): job for job in jobs}
+        for future in as_completed(futures):
+            milestone, platform_name, _ = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                logger.error(
+                    "failed provisioning %s for %s: %s"
+                    % (milestone or "latest", platform_name, e)
+                )
+                failed += 1
+                continue
+            if not entry["patched"]:
+                logger.error("driver %s is not patched" % entry["path"])
+                failed += 1
+                continue
+            logger.info("provisioned %s for %s" % (entry["version"], platform_name))
+            entries.append(entry)
+
+    if entries:
+        write_manifest(entries)
+        logger.info("wrote %s" % patcher.PROVISIONED)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
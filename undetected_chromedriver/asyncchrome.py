@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+A browser driven from asyncio, over the devtools protocol only.
+
+AsyncChrome does not use chromedriver (or selenium), and needs no threads:
+the browser is started as an asyncio subprocess, and all commands go over a
+single devtools websocket on the caller's event loop. Many browsers can be
+driven concurrently from one event loop.
+
+    async with AsyncChrome(headless=True) as browser:
+        await browser.get("https://nowsecure.nl")
+        title = await browser.execute_script("return document.title")
+        for link in await browser.find_elements("css selector", "a"):
+            print(await link.get_attribute("href"))
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import tempfile
+import weakref
+
+from .capture import ResponseCapture
+from .connection import CDPError
+from .connection import Connection
+from . import discovery
+from . import ports
+from . import readiness
+from .teardown import TeardownService
+from .teardown import remove_tree
+
+
+logger = logging.getLogger(__name__)
+
+# the selenium By values
+_FIND_FUNCTION = """
+function(by, value, many) {
+    var root = this, doc = root.ownerDocument || root, found = [];
+    if (by === "xpath") {
+        var r = doc.evaluate(value, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (var i = 0; i < r.snapshotLength; i++) found.push(r.snapshotItem(i));
+    } else if (by === "link text" || by === "partial link text") {
+        found = Array.from(root.querySelectorAll("a")).filter(function(a) {
+            var text = a.innerText.trim();
+            return by === "link text" ? text === value : text.indexOf(value) > -1;
+        });
+    } else {
+        var selector = {
+            "css selector": value,
+            "tag name": value,
+            "id": "#" + CSS.escape(value),
+            "class name": "." + CSS.escape(value),
+            "name": '[name="' + CSS.escape(value) + '"]'
+        }[by];
+        if (selector === undefined) throw new Error("unsupported locator strategy " + by);
+        found = Array.from(root.querySelectorAll(selector));
+    }
+    return many ? found : (found[0] || null);
+}
+"""
+
+
+class NoSuchElementException(Exception):
+    pass
+
+
+class AsyncElement(object):
+    """
+    A DOM element, referenced by its devtools remote object id.
+
+    The remote object is released when the last element of its object group
+    is garbage collected.
+    """
+
+    def __init__(self, browser, object_id, description=None, group=None):
+        self.browser = browser
+        self.object_id = object_id
+        self.description = description
+        if group is not None:
+            browser._hold(group)
+            weakref.finalize(self, browser._drop, group)
+
+    async def call(self, function_declaration, *args):
+        """
+        Calls the javascript function with this element as `this`, and returns the result.
+        """
+        return await self.browser._call_function(
+            self.object_id, function_declaration, *args
+        )
+
+    async def text(self):
+        return await self.call("function() { return this.innerText }")
+
+    async def get_attribute(self, name):
+        return await self.call(
+            "function(name) { return this.getAttribute(name) }", name
+        )
+
+    async def get_property(self, name):
+        return await self.call("function(name) { return this[name] }", name)
+
+    async def click(self):
+        """
+        Clicks the center of the element using real mouse events.
+        """
+        await self.call(
+            "function() { this.scrollIntoView({block: 'center', inline: 'center'}) }"
+        )
+        box = await self.browser.execute_cdp_cmd(
+            "DOM.getBoxModel", {"objectId": self.object_id}
+        )
+        quad = box["model"]["content"]
+        x = sum(quad[0::2]) / 4
+        y = sum(quad[1::2]) / 4
+        for event in ("mouseMoved", "mousePressed", "mouseReleased"):
+            await self.browser.execute_cdp_cmd(
+                "Input.dispatchMouseEvent",
+                {"type": event, "x": x, "y": y, "button": "left", "clickCount": 1},
+            )
+
+    async def send_keys(self, text):
+        """
+        Focuses the element, and types text into it.
+        """
+        await self.call("function() { this.focus() }")
+        await self.browser.execute_cdp_cmd("Input.insertText", {"text": str(text)})
+
+    async def find_element(self, by, value):
+        return await self.browser._find(self.object_id, by, value, many=False)
+
+    async def find_elements(self, by, value):
+        return await self.browser._find(self.object_id, by, value, many=True)
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(
+            self.__class__.__name__, self.description or self.object_id
+        )
+
+
+class AsyncChrome(object):
+    """
+    Chrome, driven from asyncio over the devtools protocol.
+    """
+
+    def __init__(
+        self,
+        options=None,
+        user_data_dir=None,
+        browser_executable_path=None,
+        port=0,
+        headless=False,
+        suppress_welcome=True,
+        no_sandbox=True,
+        profile_template=False,
+    ):
+        """
+        Args:
+            options: None, or a ChromeOptions. its arguments, binary_location
+                     and prefs are used.
+            user_data_dir: None = a temporary profile, removed on quit()
+            browser_executable_path: None = options.binary_location, or the found chrome
+            port: 0 = reserved from the PortAllocator
+                  the remote debugging port
+            headless: run the browser headless
+            suppress_welcome: skip the first run and default browser checks
+            no_sandbox: use --no-sandbox, needed when running as root
+            profile_template: clone the temporary profile from a ProfileTemplate
+        """
+        self.options = options
+        self.user_data_dir = user_data_dir
+        self.keep_user_data_dir = bool(user_data_dir)
+        # None = found in start()
+        self.browser_executable_path = browser_executable_path or getattr(
+            options, "binary_location", None
+        )
+        self.port = port
+        self.headless = headless
+        self.suppress_welcome = suppress_welcome
+        self.no_sandbox = no_sandbox
+        self.profile_template = profile_template
+        self.host = "127.0.0.1"
+        self.process = None
+        self.connection = None
+        self.session_id = None
+        self.target_id = None
+        self._reserved_port = None
+        self._loop = None
+        # remote object groups, with the number of AsyncElements using them
+        self._group_ids = itertools.count(1)
+        self._group_refs = {}
+
+    async def start(self):
+        """
+        Starts the browser, and attaches to its first page.
+        """
+        # file locks, subprocesses and profile copies run in the executor,
+        # so other coroutines are not held up
+        loop = self._loop = asyncio.get_event_loop()
+        if not self.browser_executable_path:
+            self.browser_executable_path = await loop.run_in_executor(
+                None, discovery.find_chrome_executable
+            )
+        if not self.browser_executable_path:
+            raise FileNotFoundError("could not determine browser executable")
+        if not self.port:
+            self.port = self._reserved_port = await loop.run_in_executor(
+                None, ports.allocator.reserve, self.host
+            )
+        await loop.run_in_executor(None, self._prepare_profile)
+        arguments = await loop.run_in_executor(None, self._arguments)
+        self.process = await asyncio.create_subprocess_exec(
+            self.browser_executable_path,
+            *arguments,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            version = await readiness.wait_for_devtools_async(self.host, self.port)
+            self.connection = Connection(version["webSocketDebuggerUrl"])
+            await self.connection.connect()
+            await self._attach()
+            if self.headless:
+                await self._configure_headless(version.get("User-Agent", ""))
+        except BaseException:
+            await self.quit()
+            raise
+        return self
+
+    def _prepare_profile(self):
+        prefs = None
+        if self.options is not None:
+            prefs = self.options.experimental_options.get("prefs")
+        if not self.user_data_dir:
+            if self.profile_template:
+                from .profiles import ProfileTemplate
+
+                template = ProfileTemplate(self.browser_executable_path, prefs=prefs)
+                self.user_data_dir = template.clone()
+                return
+            self.user_data_dir = os.path.normpath(tempfile.mkdtemp())
+        if prefs and hasattr(self.options, "handle_prefs"):
+            self.options.handle_prefs(self.user_data_dir)
+
+    def _arguments(self):
+        arguments = list(getattr(self.options, "arguments", ()))
+        arguments += [
+            "--remote-debugging-host=%s" % self.host,
+            "--remote-debugging-port=%d" % self.port,
+            "--user-data-dir=%s" % self.user_data_dir,
+            "--window-size=1920,1080",
+            "--start-maximized",
+        ]
+        if self.suppress_welcome:
+            arguments += ["--no-default-browser-check", "--no-first-run"]
+        if self.no_sandbox:
+            arguments += ["--no-sandbox", "--test-type"]
+        if self.headless:
+            major = discovery.browser_version(self.browser_executable_path)
+            major = int(major.split(".")[0]) if major else 0
+            arguments.append(
+                "--headless=chrome" if major and major < 108 else "--headless=new"
+            )
+        arguments.append("about:blank")
+        return arguments
+
+    async def _attach(self):
+        targets = await self.connection.send("Target.getTargets")
+        pages = [t for t in targets["targetInfos"] if t["type"] == "page"]
+        if pages:
+            self.target_id = pages[0]["targetId"]
+        else:
+            created = await self.connection.send(
+                "Target.createTarget", {"url": "about:blank"}
+            )
+            self.target_id = created["targetId"]
+        attached = await self.connection.send(
+            "Target.attachToTarget", {"targetId": self.target_id, "flatten": True}
+        )
+        self.session_id = attached["sessionId"]
+        await self.execute_cdp_cmd("Page.enable")
+
+    async def _configure_headless(self, user_agent):
+        await self.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument",
+            {
+                "source": """
+                    Object.defineProperty(navigator, "webdriver", {get: () => false});
+                """
+            },
+        )
+        if user_agent:
+            await self.execute_cdp_cmd(
+                "Network.setUserAgentOverride",
+                {"userAgent": user_agent.replace("Headless", "")},
+            )
+
+    async def execute_cdp_cmd(self, cmd, cmd_args=None, timeout=None):
+        """
+        Sends a devtools command to the page, and returns its result.
+        """
+        return await self.connection.send(
+            cmd, cmd_args, session_id=self.session_id, timeout=timeout
+        )
+
+    def add_cdp_listener(self, event_name, callback):
+        """
+        Calls callback(message) for each event_name event of the page ("*" for all).
+        The events' domain must be enabled, like "Network.enable" for "Network.*".
+        """
+        self.connection.add_listener(event_name, callback, self.session_id)
+
+    async def capture_response_bodies(self, **options):
+        """
+        Captures the bodies of the page's responses, streamed as they arrive.
+        options: see capture.ResponseCapture. Returns the ResponseCapture.
+        """
+        capture = ResponseCapture(**options)
+        await capture.attach(self.connection, self.session_id)
+        return capture
+
+    async def get(self, url, timeout=30):
+        """
+        Navigates to url, and waits for the load event.
+        """
+        loaded = asyncio.ensure_future(
+            self.connection.wait_for(
+                "Page.loadEventFired", self.session_id, timeout=timeout
+            )
+        )
+        try:
+            result = await self.execute_cdp_cmd("Page.navigate", {"url": url})
+            if result.get("errorText"):
+                raise CDPError("Page.navigate", result["errorText"])
+            if result.get("loaderId"):
+                # no load event for same-document navigations
+                await loaded
+        finally:
+            loaded.cancel()
+
+    async def execute_script(self, script, *args):
+        """
+        Runs script as the body of a function, like selenium does.
+        Elements can be passed as arguments, and are returned as AsyncElement.
+
+            await browser.execute_script("return arguments[0].href", link)
+        """
+        group = self._object_group()
+        try:
+            window = await self.execute_cdp_cmd(
+                "Runtime.evaluate", {"expression": "window", "objectGroup": group}
+            )
+            return await self._call_function(
+                window["result"]["objectId"],
+                "function() {\n%s\n}" % script,
+                *args,
+                group=group
+            )
+        finally:
+            await self._release_unused(group)
+
+    def _object_group(self):
+        return "uc-%d" % next(self._group_ids)
+
+    def _hold(self, group):
+        self._group_refs[group] = self._group_refs.get(group, 0) + 1
+
+    def _drop(self, group):
+        # called when an AsyncElement is garbage collected
+        self._group_refs[group] -= 1
+        if self._group_refs[group]:
+            return
+        del self._group_refs[group]
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self._release(group))
+            )
+
+    async def _release(self, group):
+        if self.connection is None:
+            return
+        try:
+            await self.execute_cdp_cmd(
+                "Runtime.releaseObjectGroup", {"objectGroup": group}
+            )
+        except (CDPError, ConnectionError, asyncio.TimeoutError) as e:
+            logger.debug("could not release %s: %s" % (group, e))
+
+    async def _release_unused(self, group):
+        # the objects of a call are released right away, unless elements use them
+        if not self._group_refs.get(group):
+            await self._release(group)
+
+    async def _call_function(self, object_id, function_declaration, *args, group=None):
+        """
+        Calls the function on the remote object, with the objects created in group.
+        Without group, they are put in a new group released after the call.
+        """
+        if group is None:
+            group = self._object_group()
+            try:
+                return await self._call_function(
+                    object_id, function_declaration, *args, group=group
+                )
+            finally:
+                await self._release_unused(group)
+        arguments = [
+            {"objectId": a.object_id} if isinstance(a, AsyncElement) else {"value": a}
+            for a in args
+        ]
+        response = await self.execute_cdp_cmd(
+            "Runtime.callFunctionOn",
+            {
+                "objectId": object_id,
+                "functionDeclaration": function_declaration,
+                "arguments": arguments,
+                "awaitPromise": True,
+                "objectGroup": group,
+            },
+        )
+        if "exceptionDetails" in response:
+            details = response["exceptionDetails"]
+            raise CDPError(
+                "Runtime.callFunctionOn",
+                details.get("exception", {}).get("description") or details.get("text"),
+            )
+        return await self._unwrap(response["result"], group)
+
+    async def _unwrap(self, remote_object, group=None):
+        """
+        Turns a Runtime.RemoteObject (of object group) into a python value.
+        """
+        subtype = remote_object.get("subtype")
+        if subtype == "node":
+            return AsyncElement(
+                self, remote_object["objectId"], remote_object.get("description"), group
+            )
+        if subtype == "array":
+            properties = await self.execute_cdp_cmd(
+                "Runtime.getProperties",
+                {"objectId": remote_object["objectId"], "ownProperties": True},
+            )
+            items = [p for p in properties["result"] if p["name"].isdigit()]
+            items.sort(key=lambda p: int(p["name"]))
+            return [await self._unwrap(p["value"], group) for p in items]
+        if "objectId" in remote_object and remote_object.get("type") == "object":
+            response = await self.execute_cdp_cmd(
+                "Runtime.callFunctionOn",
+                {
+                    "objectId": remote_object["objectId"],
+                    "functionDeclaration": "function() { return this }",
+                    "returnByValue": True,
+                },
+            )
+            return response["result"].get("value")
+        return remote_object.get("value")
+
+    async def _find(self, object_id, by, value, many, group=None):
+        found = await self._call_function(
+            object_id, _FIND_FUNCTION, by, value, many, group=group
+        )
+        if not many and found is None:
+            raise NoSuchElementException("no element found for %s %r" % (by, value))
+        return found
+
+    async def _find_in_document(self, by, value, many):
+        group = self._object_group()
+        try:
+            document = await self.execute_cdp_cmd(
+                "Runtime.evaluate", {"expression": "document", "objectGroup": group}
+            )
+            return await self._find(
+                document["result"]["objectId"], by, value, many, group
+            )
+        finally:
+            await self._release_unused(group)
+
+    async def find_element(self, by, value):
+        """
+        Returns the first element matching (by, value), with selenium's By values,
+        like ("css selector", "a.title"). Raises NoSuchElementException when there is none.
+        """
+        return await self._find_in_document(by, value, many=False)
+
+    async def find_elements(self, by, value):
+        return await self._find_in_document(by, value, many=True)
+
+    async def title(self):
+        return await self.execute_script("return document.title")
+
+    async def current_url(self):
+        return await self.execute_script("return location.href")
+
+    async def page_source(self):
+        return await self.execute_script("return document.documentElement.outerHTML")
+
+    async def quit(self):
+        """
+        Closes the connection and the browser. Removing the temporary profile
+        and releasing the port is left to the TeardownService.
+        """
+        closing = False
+        if self.connection is not None:
+            try:
+                await self.connection.send("Browser.close", timeout=2)
+                closing = True
+            except Exception:
+                pass
+            await self.connection.close()
+            self.connection = None
+        if self.process is not None and self.process.returncode is None:
+            try:
+                if not closing:
+                    self.process.terminate()
+                await asyncio.wait_for(self.process.wait(), 10)
+            except ProcessLookupError:
+                pass
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        # submit() blocks while the teardown queue is full
+        loop = asyncio.get_event_loop()
+        teardown = TeardownService.default()
+        if self.user_data_dir and not self.keep_user_data_dir:
+            await loop.run_in_executor(
+                None, teardown.submit, remove_tree, self.user_data_dir
+            )
+            self.user_data_dir = None
+        if self._reserved_port:
+            await loop.run_in_executor(
+                None, teardown.submit, ports.allocator.release, self._reserved_port
+            )
+            self._reserved_port = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.quit()
+
+    def __repr__(self):
+        return "{0:s}({1:s}:{2:d})".format(
+            self.__class__.__name__, self.host, self.port or 0
+        )
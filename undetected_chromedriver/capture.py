@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Capturing response bodies over devtools, in chunks as they arrive.
+
+For each response matching the filters, the body is requested as a stream
+(Network.streamResourceContent), after which its chunks come with the
+Network.dataReceived events. Chunks are written straight to a file in
+`directory`, passed to `on_chunk`, or else kept in memory, up to
+`max_body_size` bytes per response. When the browser cannot stream a
+response (older versions, or a response which already finished loading),
+its body is fetched with Network.getResponseBody once loaded, unless it is
+larger than `max_body_size`.
+
+    capture = driver.capture_response_bodies(
+        directory="bodies", mime_types=["application/json"]
+    )
+    driver.get(url)
+    for body in capture.completed:
+        print(body.url, body.size, body.path)
+"""
+
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import fnmatch
+import logging
+import os
+import re
+import time
+
+from .connection import CDPError
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseBody(object):
+    """
+    A captured response body.
+
+    path is set when the body is written to a file, body (bytes) when it is
+    kept in memory. truncated is set when the body exceeded max_body_size,
+    error when loading or capturing it failed.
+    """
+
+    def __init__(self, request_id, url, status, mime_type, resource_type):
+        self.request_id = request_id
+        self.url = url
+        self.status = status
+        self.mime_type = mime_type
+        self.resource_type = resource_type
+        self.size = 0
+        self.truncated = False
+        self.streamed = False
+        self.error = None
+        self.path = None
+        self.body = None
+
+    def __repr__(self):
+        return "{0:s}({1:s}, {2:d} bytes{3:s})".format(
+            self.__class__.__name__,
+            self.url,
+            self.size,
+            ", truncated" if self.truncated else "",
+        )
+
+
+class _Transfer(object):
+    def __init__(self, body, session_id=None):
+        self.body = body
+        # of the page the response belongs to
+        self.session_id = session_id
+        self.started = time.monotonic()
+        self.file = None
+        self.chunks = None
+        # chunks which arrived before the stream request returned
+        self.early = []
+        self.streaming = False
+        self.stream = None
+        self.encoded_length = None
+
+
+class ResponseCapture(object):
+    """
+    Captures the response bodies of a page, see the module docstring.
+
+    Memory use is bounded: at most `max_active` responses are followed at
+    once (others are skipped), at most `max_fetches` bodies are fetched with
+    Network.getResponseBody at once, and the last `max_completed` bodies are
+    kept in `completed`. Bodies kept in memory take up to
+    (max_active + max_completed) * max_body_size bytes.
+
+    Files are written and the callbacks are called in a thread of the
+    capture, one at a time and in order, so they do not hold up the event loop.
+    """
+
+    # responses which did not finish within this many seconds are given up
+    # on, when max_active is reached
+    stale_after = 60
+
+    def __init__(
+        self,
+        urls=None,
+        mime_types=None,
+        resource_types=("XHR", "Fetch"),
+        directory=None,
+        on_chunk=None,
+        on_complete=None,
+        max_body_size=10 * 1024 * 1024,
+        max_active=10,
+        max_completed=10,
+        max_fetches=4,
+    ):
+        """
+        Args:
+            urls: glob pattern(s) for the response url, like "*/api/*". None = any
+            mime_types: glob pattern(s) for the mime type, like "text/*". None = any
+            resource_types: devtools resource types, like "XHR" or "Document". None = any
+            directory: writes each body to directory/<request id>
+            on_chunk: callable(ResponseBody, bytes), when not writing to directory
+            on_complete: callable(ResponseBody), when a body is complete
+            max_body_size: bytes captured per response at most
+            max_active: responses followed at once at most
+            max_completed: bodies kept in .completed
+            max_fetches: Network.getResponseBody commands in flight at most
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+        if isinstance(mime_types, str):
+            mime_types = [mime_types]
+        self.urls = urls
+        self.mime_types = mime_types
+        self.resource_types = resource_types
+        self.directory = directory
+        self.on_chunk = on_chunk
+        self.on_complete = on_complete
+        self.max_body_size = max_body_size
+        self.max_active = max_active
+        self.max_fetches = max_fetches
+        self.completed = collections.deque(maxlen=max_completed)
+        self.connection = None
+        self.session_id = None
+        self.stats = {
+            "captured": 0,
+            "streamed": 0,
+            "fetched": 0,
+            "truncated": 0,
+            "failed": 0,
+            "skipped": 0,
+        }
+        self._active = {}
+        self._fetches = None
+        self._executor = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def matches(self, url, mime_type, resource_type):
+        if self.resource_types and resource_type not in self.resource_types:
+            return False
+        if self.urls and not any(fnmatch.fnmatchcase(url, p) for p in self.urls):
+            return False
+        if self.mime_types and not any(
+            fnmatch.fnmatchcase(mime_type, p) for p in self.mime_types
+        ):
+            return False
+        return True
+
+    async def attach(self, connection, session_id=None, enable=True):
+        """
+        Starts capturing the responses of connection (of session_id, for an attached target).
+
+        With session_id None and enable False, the responses of all sessions of
+        the connection are captured, for which the caller enables Network.
+        """
+        if self.connection is not None:
+            self.detach()
+        self.connection = connection
+        self.session_id = session_id
+        self._fetches = asyncio.Semaphore(self.max_fetches)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="uc-capture"
+        )
+        for method, callback in self._listeners():
+            connection.add_listener(method, callback, session_id)
+        if enable:
+            await connection.send("Network.enable", session_id=session_id)
+
+    def detach(self):
+        """
+        Stops capturing. Responses in progress are completed as they are.
+        """
+        if self.connection is None:
+            return
+        for method, callback in self._listeners():
+            self.connection.remove_listener(method, callback)
+        for transfer in list(self._active.values()):
+            if transfer.stream is not None:
+                transfer.stream.cancel()
+            self._complete(transfer, "capture stopped")
+        self.connection = None
+        # what was submitted is still written
+        self._executor.shutdown(wait=False)
+
+    @property
+    def active(self):
+        return len(self._active)
+
+    def _listeners(self):
+        return (
+            ("Network.responseReceived", self._on_response),
+            ("Network.dataReceived", self._on_data),
+            ("Network.loadingFinished", self._on_finished),
+            ("Network.loadingFailed", self._on_failed),
+        )
+
+    def _on_response(self, message):
+        params = message["params"]
+        response = params.get("response", {})
+        url = response.get("url", "")
+        mime_type = response.get("mimeType", "")
+        if not self.matches(url, mime_type, params.get("type")):
+            return
+        if len(self._active) >= self.max_active:
+            self._drop_stale()
+        if len(self._active) >= self.max_active:
+            self.stats["skipped"] += 1
+            return
+        request_id = params["requestId"]
+        transfer = _Transfer(
+            ResponseBody(
+                request_id, url, response.get("status"), mime_type, params.get("type")
+            ),
+            message.get("sessionId"),
+        )
+        if self.directory:
+            transfer.body.path = os.path.join(
+                self.directory, re.sub(r"[^\w.-]", "_", request_id)
+            )
+            self._executor.submit(self._open, transfer)
+        elif self.on_chunk is None:
+            transfer.chunks = []
+        self._active[request_id] = transfer
+        transfer.stream = asyncio.ensure_future(self._stream(transfer))
+
+    def _on_data(self, message):
+        params = message["params"]
+        transfer = self._active.get(params.get("requestId"))
+        if transfer is None or not params.get("data"):
+            return
+        chunk = base64.b64decode(params["data"])
+        if transfer.streaming:
+            self._write(transfer, chunk)
+        elif sum(map(len, transfer.early)) < self.max_body_size:
+            transfer.early.append(chunk)
+        else:
+            transfer.body.truncated = True
+
+    def _on_finished(self, message):
+        params = message["params"]
+        transfer = self._active.get(params.get("requestId"))
+        if transfer is not None:
+            transfer.encoded_length = params.get("encodedDataLength")
+            asyncio.ensure_future(self._finish(transfer))
+
+    def _on_failed(self, message):
+        params = message["params"]
+        transfer = self._active.get(params.get("requestId"))
+        if transfer is not None:
+            error = params.get("errorText") or "loading failed"
+            asyncio.ensure_future(self._finish(transfer, error))
+
+    async def _send(self, transfer, method):
+        return await self.connection.send(
+            method, {"requestId": transfer.body.request_id}, transfer.session_id
+        )
+
+    async def _stream(self, transfer):
+        try:
+            result = await self._send(transfer, "Network.streamResourceContent")
+        except (CDPError, ConnectionError, asyncio.TimeoutError) as e:
+            logger.debug("cannot stream %s: %s" % (transfer.body.url, e))
+            return False
+        transfer.streaming = transfer.body.streamed = True
+        self._write(transfer, base64.b64decode(result.get("bufferedData", "")))
+        for chunk in transfer.early:
+            self._write(transfer, chunk)
+        transfer.early = []
+        return True
+
+    async def _finish(self, transfer, error=None):
+        try:
+            streamed = await transfer.stream
+        except asyncio.CancelledError:
+            return
+        if error is None and not streamed:
+            error = await self._fetch(transfer)
+        self._complete(transfer, error)
+
+    async def _fetch(self, transfer):
+        # the encoded (compressed) length is a lower bound of the body size
+        if (transfer.encoded_length or 0) > self.max_body_size:
+            transfer.body.truncated = True
+            return
+        async with self._fetches:
+            if self.connection is None:
+                return "capture stopped"
+            try:
+                result = await self._send(transfer, "Network.getResponseBody")
+            except (CDPError, ConnectionError, asyncio.TimeoutError) as e:
+                return str(e)
+            data = result.get("body", "")
+            if result.get("base64Encoded"):
+                data = base64.b64decode(data)
+            else:
+                data = data.encode()
+            self.stats["fetched"] += 1
+            self._write(transfer, data)
+
+    def _write(self, transfer, chunk):
+        body = transfer.body
+        if self._active.get(body.request_id) is not transfer:
+            return
+        room = self.max_body_size - body.size
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            body.truncated = True
+        if not chunk:
+            return
+        body.size += len(chunk)
+        self._executor.submit(self._store, transfer, chunk)
+
+    # _open, _store and _close run in the executor, in the order submitted
+
+    def _open(self, transfer):
+        try:
+            transfer.file = open(transfer.body.path, "wb")
+        except Exception as e:
+            logger.exception("cannot open %s" % transfer.body.path)
+            transfer.body.error = str(e)
+
+    def _store(self, transfer, chunk):
+        body = transfer.body
+        if body.error:
+            return
+        try:
+            if transfer.file is not None:
+                transfer.file.write(chunk)
+            elif transfer.chunks is not None:
+                transfer.chunks.append(chunk)
+            else:
+                self.on_chunk(body, chunk)
+        except Exception as e:
+            logger.exception("capturing %s failed" % body.url)
+            body.error = str(e)
+
+    def _drop_stale(self):
+        now = time.monotonic()
+        for transfer in list(self._active.values()):
+            if now - transfer.started > self.stale_after:
+                if transfer.stream is not None:
+                    transfer.stream.cancel()
+                self._complete(transfer, "did not finish loading")
+
+    def _complete(self, transfer, error=None):
+        if self._active.pop(transfer.body.request_id, None) is None:
+            return
+        self._executor.submit(self._close, transfer, error)
+
+    def _close(self, transfer, error):
+        body = transfer.body
+        if transfer.file is not None:
+            transfer.file.close()
+        if transfer.chunks is not None:
+            body.body = b"".join(transfer.chunks)
+        body.error = error or body.error
+        self.stats["captured"] += 1
+        self.stats["streamed"] += body.streamed
+        self.stats["truncated"] += body.truncated
+        self.stats["failed"] += bool(body.error)
+        self.completed.append(body)
+        if self.on_complete is not None:
+            try:
+                self.on_complete(body)
+            except Exception:
+                logger.exception("on_complete for %s failed" % body.url)
+
+    def __repr__(self):
+        return "{0:s}(active={1:d}, captured={2:d})".format(
+            self.__class__.__name__, len(self._active), self.stats["captured"]
+        )
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 # this module is part of undetected_chromedriver
 
-import json
 import logging
 
 import requests
-import websockets
+
+from .connection import Connection
 
 
 log = logging.getLogger(__name__)
@@ -53,6 +53,7 @@ class CDP:
         self._session = requests.Session()
         self._last_resp = None
         self._last_json = None
+        self._connection = None
 
         resp = self.get(self.endpoints.json)  # noqa
         self.sessionId = resp[0]["id"]
@@ -77,15 +78,38 @@ class CDP:
         opentabs = [s for s in sessions if s["type"] == "page"]
         return self.post(self.endpoints["close"].format(id=opentabs[-1]["id"]))
 
-    async def send(self, method: str, params: dict):
+    @property
+    def connection(self):
+        """
+        The websocket connection to the current tab, kept open between commands.
+        """
+        if self._connection is None or self._connection.url != self.wsurl:
+            self._connection = Connection(self.wsurl)
+        return self._connection
+
+    async def send(self, method: str, params: dict = None):
+        """
+        Sends a devtools command to the current tab, and returns the result.
+        Commands may be sent concurrently, the connection is shared.
+        """
         self._reqid += 1
-        async with websockets.connect(self.wsurl) as ws:
-            await ws.send(
-                json.dumps({"method": method, "params": params, "id": self._reqid})
-            )
-            self._last_resp = await ws.recv()
-            self._last_json = json.loads(self._last_resp)
-            self.log.info(self._last_json)
+        result = await self.connection.send(method, params)
+        self._last_resp = result
+        self._last_json = {"id": self._reqid, "result": result}
+        self.log.info(self._last_json)
+        return result
+
+    def add_listener(self, method: str, callback):
+        """
+        Calls callback(message) for each event named method ("*" for all events) of the current tab.
+        The domain must be enabled, like await cdp.send("Network.enable") for "Network.*" events.
+        """
+        self.connection.add_listener(method, callback)
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
 
     def get(self, uri):
         resp = self._session.get(self.server_addr + uri)
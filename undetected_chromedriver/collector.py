@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+import json
+import logging
+import os
+import threading
+import time
+
+from . import patcher
+from .dprocess import pid_alive
+from .locking import FileLock
+
+
+logger = logging.getLogger(__name__)
+
+
+class DriverCollector(object):
+    """
+    Removes driver binaries nobody uses anymore.
+
+    Instance binaries are named <pid>_<uuid>, after the process holding them.
+    Instances whose process is gone (for example a crashed worker) are orphans and
+    are removed. Store entries are reference counted by their number of hardlinks:
+    an entry without instances linked to it may be evicted, least recently linked
+    first, to keep the store within max_store_entries / max_store_bytes.
+    Drivers pre-baked by `python -m undetected_chromedriver` or registered
+    by the Patcher (see Patcher.register) are never evicted. Manifests of
+    binaries which are neither in the store nor instances (like a custom
+    driver_executable_path) are removed after manifest_max_age seconds.
+
+    Run it in the background with DriverCollector.schedule(), which never blocks.
+    """
+
+    # seconds between background runs
+    interval = 60
+    # budget for patched drivers in the store, None = unbounded
+    max_store_entries = 8
+    max_store_bytes = None
+    # seconds before the manifest of a binary outside the store is removed
+    manifest_max_age = 7 * 24 * 3600
+
+    _thread = None
+    _last_run = 0.0
+    _schedule_lock = threading.Lock()
+
+    def __init__(self, instances_path=None, store_path=None):
+        # looked up at runtime, patcher.set_cache_dir() might have changed them
+        self.instances_path = instances_path or patcher.INSTANCE_DRIVERS
+        self.store_path = store_path or patcher.PATCHED_DRIVERS
+
+    @classmethod
+    def schedule(cls, force=False):
+        """
+        Starts a collection in a background thread, unless one ran less
+        than `interval` seconds ago or is still running.
+        """
+        with cls._schedule_lock:
+            if cls._thread and cls._thread.is_alive():
+                return False
+            if not force and time.monotonic() - cls._last_run < cls.interval:
+                return False
+            cls._last_run = time.monotonic()
+            cls._thread = threading.Thread(
+                target=cls()._collect_quietly, name="uc-driver-collector", daemon=True
+            )
+            cls._thread.start()
+            return True
+
+    def _collect_quietly(self):
+        try:
+            self.collect()
+        except Exception as e:
+            logger.debug("driver collection failed: %s" % e)
+
+    def collect(self):
+        """
+        Removes orphaned instances, then enforces the store budget, then
+        removes stale manifests. Returns the list of removed paths.
+        """
+        removed = self.collect_orphans()
+        removed += self.enforce_budget()
+        removed += self.collect_manifests()
+        return removed
+
+    def instances(self):
+        """
+        Returns a dict {instance path: owner pid}.
+        Instances created by older versions have no owner pid (None).
+        """
+        result = {}
+        try:
+            names = os.listdir(self.instances_path)
+        except FileNotFoundError:
+            return result
+        for name in names:
+            pid, sep, _ = name.partition("_")
+            result[os.path.join(self.instances_path, name)] = (
+                int(pid) if sep and pid.isdigit() else None
+            )
+        return result
+
+    def collect_orphans(self):
+        removed = []
+        for path, pid in self.instances().items():
+            if pid is not None and pid_alive(pid):
+                continue
+            try:
+                patcher.remove_instance(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                # still in use on windows, try again next time
+                logger.debug("could not remove orphan %s: %s" % (path, e))
+                continue
+            logger.debug("removed orphaned instance %s (pid %s)" % (path, pid))
+            removed.append(path)
+        return removed
+
+    def store_entries(self):
+        """
+        Returns a list of (path, stat) of all patched drivers in the store.
+        """
+        entries = []
+        try:
+            dirs = os.listdir(self.store_path)
+        except FileNotFoundError:
+            return entries
+        for d in dirs:
+            d = os.path.join(self.store_path, d)
+            try:
+                names = os.listdir(d)
+            except NotADirectoryError:
+                continue
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(d, name)
+                try:
+                    entries.append((path, os.stat(path)))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def pinned(self):
+        """
+        Returns the set of store paths listed in the provisioned manifest
+        or the registry, which are managed by the Patcher instead.
+        """
+        base = os.path.dirname(patcher.PROVISIONED)
+        try:
+            with open(patcher.PROVISIONED, encoding="utf-8") as fh:
+                drivers = json.load(fh)["drivers"]
+        except (OSError, ValueError, KeyError):
+            drivers = []
+        drivers += patcher.Patcher.read_registry().values()
+        return {os.path.join(base, d["path"]) for d in drivers}
+
+    def enforce_budget(self):
+        if self.max_store_entries is None and self.max_store_bytes is None:
+            return []
+        entries = self.store_entries()
+        pinned = self.pinned()
+        count, size = len(entries), sum(st.st_size for _, st in entries)
+        if not self._over_budget(count, size):
+            return []
+
+        removed = []
+        lock = FileLock(patcher.PROVISION_LOCK, timeout=0)
+        try:
+            lock.acquire()
+        except TimeoutError:
+            # provisioning in progress, it might be linking an entry right now
+            return removed
+        try:
+            # the link count changes when instances are added, so ctime tells
+            # when an entry was linked last. entries with instances are in use.
+            for path, st in sorted(entries, key=lambda e: e[1].st_ctime):
+                if not self._over_budget(count, size):
+                    break
+                if path in pinned or os.stat(path).st_nlink > 1:
+                    continue
+                patcher.remove_store_entry(path)
+                removed.append(path)
+                count, size = count - 1, size - st.st_size
+        finally:
+            lock.release()
+        return removed
+
+    def collect_manifests(self):
+        """
+        Removes the manifests of binaries outside the store and the instances,
+        once they were not written for manifest_max_age seconds.
+        """
+        removed = []
+        try:
+            names = os.listdir(patcher.MANIFESTS)
+        except FileNotFoundError:
+            return removed
+        live = {"%d-%d.json" % (st.st_dev, st.st_ino) for _, st in self.store_entries()}
+        for path in self.instances():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            live.add("%d-%d.json" % (st.st_dev, st.st_ino))
+        now = time.time()
+        for name in names:
+            if name in live:
+                continue
+            path = os.path.join(patcher.MANIFESTS, name)
+            try:
+                if now - os.stat(path).st_mtime < self.manifest_max_age:
+                    continue
+                os.unlink(path)
+            except OSError:
+                continue
+            logger.debug("removed stale manifest %s" % path)
+            removed.append(path)
+        return removed
+
+    def _over_budget(self, count, size):
+        return (self.max_store_entries is not None and count > self.max_store_entries) or (
+            self.max_store_bytes is not None and size > self.max_store_bytes
+        )
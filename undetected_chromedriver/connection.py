@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+A single, long lived websocket connection to the devtools of a browser or page.
+
+Many commands can be in flight at once, responses are matched to them by id.
+Messages without an id are events, and go to the listeners registered for
+their method.
+
+Events are prefiltered: their method is read from the raw frame, and events
+nobody listens for are dropped without being parsed. The others are passed
+to the listeners as plain dicts. orjson is used for decoding when it is
+installed.
+
+A lost connection is re-established on the next command, and the domains
+which were enabled (like "Network.enable") are enabled again. Commands in
+flight when the connection is lost raise ConnectionError.
+
+    conn = Connection("ws://127.0.0.1:9222/devtools/browser/...")
+    await conn.connect()
+    conn.add_listener("Page.loadEventFired", on_load)
+    result = await conn.send("Target.getTargets")
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import re
+
+import websockets
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
+# devtools serializes events as {"method": ..., "params": ..., "sessionId": ...}
+_EVENT_RE = re.compile(r'\s*\{\s*"method"\s*:\s*"([^"\\]+)"')
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+class CDPError(Exception):
+    """
+    Raised for error responses to devtools commands.
+    """
+
+    def __init__(self, method, error):
+        if isinstance(error, dict):
+            message = "%s (%s)" % (error.get("message"), error.get("code"))
+            if error.get("data"):
+                message += ": %s" % error["data"]
+        else:
+            message = str(error)
+        super().__init__("%s failed: %s" % (method, message))
+        self.method = method
+        self.error = error
+
+
+class Connection(object):
+    """
+    Devtools protocol connection, for use on a single event loop.
+    """
+
+    # seconds to wait for a response, None = forever
+    timeout = 30
+    # attempts to (re)connect, with doubling delays in between
+    connect_attempts = 4
+    connect_retry_delay = 0.1
+
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = {}
+        self._reader = None
+        self._loop = None
+        # serializes connecting, for concurrent commands on a new connection
+        self._connect_lock = None
+        self._connected_before = False
+        # "<Domain>.enable" commands sent, with their params and session,
+        # replayed after a reconnect
+        self._enabled = {}
+        self._closed = False
+        self.reconnects = 0
+        # optional callable(method) -> bool, deciding which events go to "*" listeners
+        self.event_filter = None
+        # events dropped without being parsed
+        self.skipped = 0
+
+    @property
+    def connected(self):
+        return self._reader is not None and not self._reader.done()
+
+    async def connect(self):
+        self._closed = False
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            # the websocket belongs to another (probably closed) loop, like
+            # when each command runs in its own asyncio.run()
+            self._fail_pending(ConnectionError("event loop changed"))
+            self._abandon()
+            self._reader = None
+            self._loop = loop
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not self.connected:
+                await self._connect()
+        return self
+
+    async def _connect(self):
+        reconnect = self._connected_before
+        delay = self.connect_retry_delay
+        for attempt in range(self.connect_attempts):
+            try:
+                # no max_size, large results (screenshots, response bodies) are common
+                self.ws = await websockets.connect(
+                    self.url, max_size=None, ping_interval=None
+                )
+                break
+            except (OSError, websockets.InvalidHandshake) as e:
+                if attempt == self.connect_attempts - 1:
+                    raise ConnectionError(
+                        "could not connect to %s: %s" % (self.url, e)
+                    ) from e
+                await asyncio.sleep(delay)
+                delay *= 2
+        self._reader = asyncio.ensure_future(self._read())
+        self._connected_before = True
+        logger.debug("connected to %s" % self.url)
+        if reconnect:
+            self.reconnects += 1
+            for (method, session_id), params in list(self._enabled.items()):
+                try:
+                    await self.send(method, params, session_id)
+                except CDPError as e:
+                    # sessions of attached targets do not survive a reconnect
+                    logger.debug("could not restore %s: %s" % (method, e))
+                    self._enabled.pop((method, session_id), None)
+
+    def _abandon(self):
+        # drops the websocket of the previous loop, closing its transport
+        # there if that loop is still alive (otherwise _read closed it when
+        # the loop shut down)
+        ws, self.ws = self.ws, None
+        if ws is None or self._loop is None or self._loop.is_closed():
+            return
+        try:
+            self._loop.call_soon_threadsafe(ws.transport.abort)
+        except RuntimeError:
+            pass
+
+    async def close(self):
+        self._closed = True
+        reader, self._reader = self._reader, None
+        if self.ws is not None:
+            await self.ws.close()
+        if reader is not None:
+            await asyncio.gather(reader, return_exceptions=True)
+        self._fail_pending(ConnectionError("connection to %s closed" % self.url))
+
+    async def send(self, method, params=None, session_id=None, timeout=None):
+        """
+        Sends a command, and returns the result of its response.
+
+        Args:
+            method: like "Page.navigate"
+            params: dict, or None
+            session_id: for commands to an attached target (flat mode)
+            timeout: seconds, None = Connection.timeout
+
+        Raises CDPError for error responses, and ConnectionError when the
+        connection is lost before the response arrived.
+        """
+        if self._closed:
+            raise ConnectionError("connection to %s is closed" % self.url)
+        if not self.connected or self._loop is not asyncio.get_event_loop():
+            await self.connect()
+        if method.endswith(".enable"):
+            self._enabled[(method, session_id)] = params
+        elif method.endswith(".disable"):
+            self._enabled.pop((method[: -len("disable")] + "enable", session_id), None)
+        message = {"id": next(self._ids), "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending[message["id"]] = (method, future)
+        try:
+            try:
+                await self.ws.send(dumps(message))
+            except (websockets.ConnectionClosed, OSError) as e:
+                # closed before the reader noticed
+                raise ConnectionError(
+                    "connection to %s lost: %s" % (self.url, e)
+                ) from e
+            return await asyncio.wait_for(
+                future, self.timeout if timeout is None else timeout
+            )
+        finally:
+            self._pending.pop(message["id"], None)
+
+    def add_listener(self, method, callback, session_id=None):
+        """
+        Calls callback(message) for each event named method ("*" for all events).
+        When session_id is given, only for events of that session.
+        Coroutine functions are scheduled as tasks.
+        """
+        self._listeners.setdefault(method, []).append((callback, session_id))
+
+    def remove_listener(self, method, callback=None):
+        if callback is None:
+            self._listeners.pop(method, None)
+            return
+        self._listeners[method] = [
+            entry for entry in self._listeners.get(method, []) if entry[0] != callback
+        ]
+
+    async def wait_for(self, method, session_id=None, timeout=None):
+        """
+        Waits for the next event named method, and returns it.
+        """
+        future = asyncio.get_event_loop().create_future()
+
+        def done(message):
+            if not future.done():
+                future.set_result(message)
+
+        self.add_listener(method, done, session_id)
+        try:
+            return await asyncio.wait_for(
+                future, self.timeout if timeout is None else timeout
+            )
+        finally:
+            self.remove_listener(method, done)
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                match = _EVENT_RE.match(raw) if isinstance(raw, str) else None
+                if match is None:
+                    message = loads(raw)
+                    if "id" in message:
+                        self._resolve(message)
+                    else:
+                        self._dispatch(message)
+                elif self._wants(match.group(1)):
+                    self._dispatch(loads(raw))
+                else:
+                    self.skipped += 1
+        except websockets.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            # the loop shuts down (like at the end of asyncio.run), the
+            # websocket cannot be used from another loop
+            try:
+                await asyncio.wait_for(self.ws.close(), 1)
+            except Exception:
+                self.ws.transport.abort()
+            raise
+        except Exception as e:
+            logger.warning("reading from %s failed: %s" % (self.url, e))
+        finally:
+            self._fail_pending(ConnectionError("connection to %s lost" % self.url))
+
+    def _wants(self, method):
+        if self._listeners.get(method):
+            return True
+        if self._listeners.get("*"):
+            return self.event_filter is None or self.event_filter(method)
+        return False
+
+    def _resolve(self, message):
+        method, future = self._pending.get(message["id"], (None, None))
+        if future is None or future.done():
+            return
+        if "error" in message:
+            future.set_exception(CDPError(method, message["error"]))
+        else:
+            future.set_result(message.get("result", {}))
+
+    def _dispatch(self, message):
+        method = message.get("method")
+        for key in (method, "*"):
+            if key == "*" and self.event_filter and not self.event_filter(method):
+                continue
+            for callback, wanted in list(self._listeners.get(key, ())):
+                if wanted and wanted != message.get("sessionId"):
+                    continue
+                try:
+                    if asyncio.iscoroutinefunction(callback):
+                        asyncio.ensure_future(callback(message))
+                    else:
+                        callback(message)
+                except Exception:
+                    logger.exception("listener for %s failed" % method)
+
+    def _fail_pending(self, exc):
+        for method, future in list(self._pending.values()):
+            if not future.done():
+                future.set_exception(exc)
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(self.__class__.__name__, self.url)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Finding the browser executable, and the versions of executables.
+
+Both are cached per process and in <Patcher.data_path>/discovery.json, so other
+processes do not have to search PATH or run `<executable> --version` again.
+A cached version is used for as long as the executable's inode and mtime are
+unchanged, a cached browser path for as long as the search locations (PATH)
+are unchanged and the executable is still there.
+
+    path = find_chrome_executable()
+    browser_version(path)       # => "120.0.6099.109"
+    executable_version(driver)  # => "120.0.6099.109"
+"""
+
+from distutils.version import LooseVersion
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+from uuid import uuid4
+
+
+logger = logging.getLogger(__name__)
+
+IS_POSIX = sys.platform.startswith(("darwin", "cygwin", "linux", "linux2"))
+
+_VERSION_RE = re.compile(r"\d+(?:\.\d+){2,3}")
+
+
+class DiscoveryCache(object):
+    """
+    A json file holding discovered browser paths and executable versions.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path: None = <Patcher.data_path>/discovery.json
+        """
+        self._path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path is None:
+            from .patcher import Patcher
+
+            return os.path.join(Patcher.data_path, "discovery.json")
+        return self._path
+
+    def _load(self, reload=False):
+        if self._data is None or reload:
+            try:
+                with io.open(self.path, "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                data = {}
+            data.setdefault("browsers", {})
+            data.setdefault("versions", {})
+            self._data = data
+        return self._data
+
+    def _save(self):
+        tmp_path = "%s.%s.tmp" % (self.path, uuid4().hex)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with io.open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(self._data, fh, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.debug("could not write %s: %s" % (self.path, e))
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, section, key, check):
+        """
+        Returns the entry for key if check(entry) holds, looking in
+        the file as well when this process has no valid entry.
+        """
+        with self._lock:
+            for reload in (False, True):
+                entry = self._load(reload)[section].get(key)
+                if entry is not None and check(entry):
+                    return entry
+        return None
+
+    def put(self, section, key, entry):
+        with self._lock:
+            # merge with what other processes found meanwhile
+            self._load(reload=True)[section][key] = entry
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._data = {"browsers": {}, "versions": {}}
+            self._save()
+
+
+cache = DiscoveryCache()
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return {"ino": st.st_ino, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _unchanged(path):
+    def check(entry):
+        try:
+            return entry.get("stat") == _stat_key(path)
+        except OSError:
+            return False
+
+    return check
+
+
+def chrome_candidates():
+    """
+    Returns the paths the browser is looked for at, in order of preference.
+    """
+    candidates = []
+    if IS_POSIX:
+        for item in os.environ.get("PATH", "").split(os.pathsep):
+            for subitem in (
+                "google-chrome",
+                "chromium",
+                "chromium-browser",
+                "chrome",
+                "google-chrome-stable",
+            ):
+                candidates.append(os.sep.join((item, subitem)))
+        if "darwin" in sys.platform:
+            candidates.extend(
+                [
+                    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+                    "/Applications/Chromium.app/Contents/MacOS/Chromium",
+                ]
+            )
+    else:
+        for item in map(
+            os.environ.get,
+            ("PROGRAMFILES", "PROGRAMFILES(X86)", "LOCALAPPDATA", "PROGRAMW6432"),
+        ):
+            if item is not None:
+                for subitem in ("Google/Chrome/Application",):
+                    candidates.append(os.sep.join((item, subitem, "chrome.exe")))
+    # keep the first occurrence of each
+    return list(dict.fromkeys(candidates))
+
+
+def find_chrome_executable(refresh=False):
+    """
+    Finds the chrome, chrome beta, chrome canary, chromium executable
+
+    Args:
+        refresh: ignore the cache, and search again
+
+    Returns: the full file path to found executable, or None
+    """
+    candidates = chrome_candidates()
+    key = hashlib.sha1("\0".join(candidates).encode("utf-8", "replace")).hexdigest()
+    if not refresh:
+        entry = cache.get("browsers", key, _found)
+        if entry:
+            return entry["path"]
+    for candidate in candidates:
+        logger.debug("checking if %s exists and is executable" % candidate)
+        if os.path.exists(candidate) and os.access(candidate, os.X_OK):
+            logger.debug("found! using %s" % candidate)
+            path = os.path.normpath(candidate)
+            cache.put("browsers", key, {"path": path, "stat": _stat_key(path)})
+            return path
+    return None
+
+
+def _found(entry):
+    path = entry.get("path")
+    return bool(path) and os.access(path, os.X_OK) and _unchanged(path)(entry)
+
+
+def executable_version(path, windows_browser=False):
+    """
+    Returns the version (like "120.0.6099.109") of the executable at path,
+    or None if it cannot be determined. Cached for as long as the executable
+    does not change.
+
+    Args:
+        path: browser or chromedriver executable
+        windows_browser: take the version from the version folder next to
+            chrome.exe, instead of running it
+    """
+    try:
+        realpath = os.path.realpath(path)
+        stat = _stat_key(realpath)
+    except (OSError, TypeError, ValueError):
+        return None
+    entry = cache.get("versions", realpath, _unchanged(realpath))
+    if entry:
+        return entry["version"]
+
+    version = None
+    if windows_browser:
+        candidates = [
+            name
+            for name in os.listdir(os.path.dirname(realpath))
+            if _VERSION_RE.fullmatch(name)
+        ]
+        if candidates:
+            version = max(candidates, key=LooseVersion)
+    else:
+        try:
+            output = subprocess.check_output(
+                [path, "--version"], stderr=subprocess.DEVNULL, timeout=10
+            ).decode(errors="replace")
+            match = _VERSION_RE.search(output)
+            if match:
+                version = match[0]
+        except (OSError, subprocess.SubprocessError) as e:
+            # might be temporary, so not cached
+            logger.debug("could not get version of %s: %s" % (path, e))
+            return None
+    logger.debug("%s has version %s" % (path, version))
+    cache.put("versions", realpath, {"version": version, "stat": stat})
+    return version
+
+
+def browser_version(path):
+    """
+    Returns the version of the browser executable at path, or None if it cannot be determined.
+
+    On windows, it is taken from the version folder next to chrome.exe,
+    elsewhere by running `<browser> --version`.
+    """
+    return executable_version(path, windows_browser=sys.platform.startswith("win"))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Delivering events to handlers, without one handler holding up the others.
+
+Each handler gets its own bounded queue and worker tasks. Events are handed
+to the queues without waiting, so a full queue never holds up the delivery
+to the other handlers. When a queue is full, its overflow policy decides
+what happens:
+
+    BUFFER       hold the event back until there is room, up to max_queue
+                 further events (and drop it beyond that, with a warning);
+                 only this handler falls behind
+    DROP_OLDEST  discard the oldest queued event to make room
+    DROP_NEWEST  discard the new event
+
+Handlers can take events one at a time, or in batches (a list of events).
+Plain functions are run in the Dispatcher's executor (the loop's default one
+if it has none), coroutine functions are awaited on the loop.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+BUFFER = "buffer"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+def check_options(options):
+    """
+    Raises ValueError for options (a dict) which Subscription does not accept.
+    """
+    unknown = set(options) - {
+        "max_queue",
+        "concurrency",
+        "batch_size",
+        "batch_timeout",
+        "overflow",
+    }
+    if unknown:
+        raise ValueError("unknown handler options: %s" % ", ".join(sorted(unknown)))
+    for name in ("max_queue", "concurrency", "batch_size"):
+        value = options.get(name)
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise ValueError("%s must be a positive int, not %r" % (name, value))
+    batch_timeout = options.get("batch_timeout", 0)
+    if not isinstance(batch_timeout, (int, float)) or batch_timeout < 0:
+        raise ValueError("batch_timeout must be >= 0, not %r" % (batch_timeout,))
+    overflow = options.get("overflow", BUFFER)
+    if overflow not in (BUFFER, DROP_OLDEST, DROP_NEWEST):
+        raise ValueError("unknown overflow policy %r" % (overflow,))
+
+
+class Subscription(object):
+    """
+    A handler with its queue and workers. Must be created on the loop it runs on.
+    """
+
+    def __init__(
+        self,
+        callback,
+        max_queue=1000,
+        concurrency=1,
+        batch_size=None,
+        batch_timeout=0.05,
+        overflow=BUFFER,
+        executor=None,
+    ):
+        """
+        Args:
+            callback: callable accepting an event (or a list of events when batching)
+            max_queue: number of events queued at most (and held back, for BUFFER)
+            concurrency: number of calls to callback running at once
+            batch_size: None = one event per call
+                        otherwise, up to batch_size events per call
+            batch_timeout: seconds to wait for a batch to fill up
+            overflow: BUFFER, DROP_OLDEST or DROP_NEWEST
+            executor: concurrent.futures.Executor running plain functions,
+                      None = the loop's default executor
+        """
+        check_options(
+            dict(
+                max_queue=max_queue,
+                concurrency=concurrency,
+                batch_size=batch_size,
+                batch_timeout=batch_timeout,
+                overflow=overflow,
+            )
+        )
+        self.callback = callback
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.overflow = overflow
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # events held back for BUFFER, until the queue has room
+        self.waiting = collections.deque()
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.calls = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._workers = [
+            asyncio.ensure_future(self._work()) for _ in range(max(1, concurrency))
+        ]
+
+    def put(self, message):
+        """
+        Queues message without waiting, applying the overflow policy when full.
+        """
+        self.received += 1
+        if self.queue.full() or self.waiting:
+            if self.overflow == DROP_OLDEST:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+            elif self.overflow == BUFFER and len(self.waiting) < self.queue.maxsize:
+                self.waiting.append(message)
+                return
+            else:
+                if self.overflow == BUFFER and not self.dropped:
+                    logger.warning(
+                        "handler %r is %d events behind, dropping further events"
+                        % (self.callback, self.queue.qsize() + len(self.waiting))
+                    )
+                self.dropped += 1
+                return
+        self.queue.put_nowait(message)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _refill(self):
+        while self.waiting and not self.queue.full():
+            self.queue.put_nowait(self.waiting.popleft())
+
+    async def _next(self):
+        messages = [await self.queue.get()]
+        self._refill()
+        if self.batch_size:
+            deadline = asyncio.get_event_loop().time() + self.batch_timeout
+            while len(messages) < self.batch_size:
+                remaining = deadline - asyncio.get_event_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    messages.append(
+                        await asyncio.wait_for(self.queue.get(), remaining)
+                    )
+                    self._refill()
+                except asyncio.TimeoutError:
+                    break
+        return messages
+
+    async def _work(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            messages = await self._next()
+            argument = messages if self.batch_size else messages[0]
+            start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(self.callback):
+                    await self.callback(argument)
+                else:
+                    await loop.run_in_executor(
+                        self.executor, self.callback, argument
+                    )
+                self.delivered += len(messages)
+            except Exception:
+                self.failed += len(messages)
+                logger.exception("handler %r failed" % self.callback)
+            finally:
+                latency = time.perf_counter() - start
+                self.calls += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                for _ in messages:
+                    self.queue.task_done()
+
+    def close(self):
+        for worker in self._workers:
+            worker.cancel()
+
+    @property
+    def stats(self):
+        return {
+            "depth": self.queue.qsize(),
+            "waiting": len(self.waiting),
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "calls": self.calls,
+            "latency_avg": self.latency_total / self.calls if self.calls else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    def __repr__(self):
+        return "{0:s}({1:s}, depth={2:d}, dropped={3:d})".format(
+            self.__class__.__name__,
+            getattr(self.callback, "__name__", repr(self.callback)),
+            self.queue.qsize(),
+            self.dropped,
+        )
+
+
+class Dispatcher(object):
+    """
+    Routes events to a Subscription per key. Runs on a single event loop.
+    """
+
+    def __init__(self, executor=None):
+        """
+        Args:
+            executor: concurrent.futures.Executor shared by the subscriptions
+                      for running plain functions, None = the loop's default
+        """
+        self.executor = executor
+        self.subscriptions = {}
+
+    def subscribe(self, key, callback, **options):
+        """
+        Subscribes callback to key, replacing an existing subscription.
+        options are passed to Subscription.
+        """
+        self.unsubscribe(key)
+        subscription = Subscription(callback, executor=self.executor, **options)
+        subscription.options = options
+        self.subscriptions[key] = subscription
+        return subscription
+
+    def unsubscribe(self, key):
+        subscription = self.subscriptions.pop(key, None)
+        if subscription is not None:
+            subscription.close()
+
+    def dispatch(self, key, message):
+        """
+        Queues message for the subscription of key. Returns False if there is none.
+        """
+        subscription = self.subscriptions.get(key)
+        if subscription is None:
+            return False
+        subscription.put(message)
+        return True
+
+    async def join(self):
+        """
+        Waits until all queued events are handled.
+        """
+        for subscription in list(self.subscriptions.values()):
+            await subscription.queue.join()
+
+    def close(self):
+        for key in list(self.subscriptions):
+            self.unsubscribe(key)
+
+    @property
+    def stats(self):
+        return {key: s.stats for key, s in self.subscriptions.items()}
@@ -62,6 +62,39 @@ def _start_detached(executable, *args, writer: multiprocessing.Pipe = None):
     sys.exit()
 
 
+def pid_alive(pid):
+    """
+    Checks whether a process with the given pid is running.
+    :param pid: process id
+    :return: bool
+    """
+    if pid <= 0:
+        return False
+    if platform.system() == "Windows":
+        import ctypes
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but owned by another user
+        return True
+    return True
+
+
 def _cleanup():
     for pid in REGISTERED:
         try:
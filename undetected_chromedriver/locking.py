@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+import io
+import logging
+import os
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+
+IS_WINDOWS = sys.platform.startswith("win")
+
+if IS_WINDOWS:
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock(object):
+    """
+    Exclusive lock shared by all processes (and threads) using the same lock file.
+
+    Every acquire opens its own file descriptor, so a FileLock object should not
+    be shared between threads, create one per use instead:
+
+        with FileLock("/path/to/.lock") as lock:
+            ...
+        print("waited %.3f seconds" % lock.wait_time)
+    """
+
+    def __init__(self, path, timeout=None, poll_interval=0.05):
+        """
+        Args:
+            path: path of the lock file, created if it does not exist
+            timeout: None = wait forever
+                     seconds to wait before raising TimeoutError
+            poll_interval: seconds between attempts, when polling is needed
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.wait_time = 0.0
+        self._fh = None
+
+    @property
+    def locked(self):
+        return self._fh is not None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fh = io.open(self.path, "a+b")
+        start = time.perf_counter()
+        try:
+            if not IS_WINDOWS and self.timeout is None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            else:
+                while not self._try_lock(fh):
+                    if (
+                        self.timeout is not None
+                        and time.perf_counter() - start > self.timeout
+                    ):
+                        raise TimeoutError("could not acquire lock %s" % self.path)
+                    time.sleep(self.poll_interval)
+        except BaseException:
+            fh.close()
+            raise
+        self.wait_time = time.perf_counter() - start
+        self._fh = fh
+        logger.debug("acquired %s after %.3f seconds" % (self.path, self.wait_time))
+        return self
+
+    def release(self):
+        fh, self._fh = self._fh, None
+        if fh is None:
+            return
+        try:
+            if IS_WINDOWS:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+    @staticmethod
+    def _try_lock(fh):
+        try:
+            if IS_WINDOWS:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __repr__(self):
+        return "{0:s}({1:s}, locked={2})".format(
+            self.__class__.__name__, self.path, self.locked
+        )
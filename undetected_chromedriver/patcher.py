@@ -1,3 +1,4 @@
+import contextlib
 import os
 import pathlib
 import shutil
@@ -8,26 +9,164 @@ import string
 import sys
 import time
 import io
+import hashlib
 import json
+import mmap
 import re
-from urllib.request import urlopen, urlretrieve
-from multiprocessing import Lock
 from distutils.version import LooseVersion
 import logging
 
+from .discovery import browser_version
+from .locking import FileLock
+from .repository import HTTPRepository
+from .repository import repository_from_urls
+
 logger = logging.getLogger(__name__)
 
 IS_POSIX = sys.platform.startswith(("darwin", "cygwin", "linux", "linux2"))
 
-_BASE_DRIVER_PATH = os.path.join(str(pathlib.Path(__name__).parent.resolve()), ".ucdriver")
-DRIVER_PATH = os.path.join(_BASE_DRIVER_PATH, "base_driver")
-INSTANCE_DRIVERS = os.path.join(_BASE_DRIVER_PATH, "instances")
-os.makedirs(_BASE_DRIVER_PATH, exist_ok=True)
-os.makedirs(INSTANCE_DRIVERS, exist_ok=True, mode=0o755)
+_BASE_DRIVER_PATH = DRIVER_PATH = INSTANCE_DRIVERS = PATCHED_DRIVERS = None
+MANIFESTS = PROVISION_LOCK = PROVISIONED = REGISTRY = None
+
+
+def set_cache_dir(path):
+    """
+    Sets the folder holding the downloaded, patched and instance drivers.
+
+    Defaults to $UC_DRIVER_CACHE, or .ucdriver in the working directory.
+    Drivers pre-baked using `python -m undetected_chromedriver` are picked up from here.
+    """
+    global _BASE_DRIVER_PATH, DRIVER_PATH, INSTANCE_DRIVERS, PATCHED_DRIVERS
+    global MANIFESTS, PROVISION_LOCK, PROVISIONED, REGISTRY
+    _BASE_DRIVER_PATH = os.path.abspath(path)
+    DRIVER_PATH = os.path.join(_BASE_DRIVER_PATH, "base_driver")
+    INSTANCE_DRIVERS = os.path.join(_BASE_DRIVER_PATH, "instances")
+    PATCHED_DRIVERS = os.path.join(_BASE_DRIVER_PATH, "patched")
+    MANIFESTS = os.path.join(_BASE_DRIVER_PATH, "manifests")
+    # held while downloading, unzipping and patching, so only one process does so
+    PROVISION_LOCK = os.path.join(_BASE_DRIVER_PATH, ".lock")
+    # written by `python -m undetected_chromedriver`
+    PROVISIONED = os.path.join(_BASE_DRIVER_PATH, "provisioned.json")
+    # patched drivers per browser major version, see Patcher.register()
+    REGISTRY = os.path.join(_BASE_DRIVER_PATH, "registry.json")
+    os.makedirs(_BASE_DRIVER_PATH, exist_ok=True)
+    os.makedirs(INSTANCE_DRIVERS, exist_ok=True, mode=0o755)
+    os.makedirs(PATCHED_DRIVERS, exist_ok=True, mode=0o755)
+    os.makedirs(MANIFESTS, exist_ok=True)
+
+
+set_cache_dir(
+    os.environ.get("UC_DRIVER_CACHE")
+    or os.path.join(str(pathlib.Path(__name__).parent.resolve()), ".ucdriver")
+)
+
+_PATCH_MARKER = b"undetected chromedriver"
+_PATCH_BLOCK = b'{console.log("undetected chromedriver 1337!")}'
+# finds the injection block and already patched blocks in a single pass
+_PATCH_SCAN = re.compile(rb"\{window\.cdc.*?;\}|" + re.escape(_PATCH_MARKER))
+_PATCH_SCAN_MARKER = re.compile(re.escape(_PATCH_MARKER))
+_VERSION_SCAN = re.compile(rb"platform_handle\x00content\x00([0-9.]*)")
+
+# linux ioctl to share extents between two files (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """
+    Creates dst as a copy-on-write clone of src.
+    Returns False if the platform or filesystem does not support it.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+    shutil.copymode(src, dst)
+    return True
+
+
+def _mmap_search(path, pattern):
+    """
+    Searches a compiled bytes pattern in a memory-mapped file.
+    Returns the match (with its groups copied out of the map) or None.
+    """
+    with io.open(path, "rb") as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return None
+        with mm:
+            match = pattern.search(mm)
+            if match:
+                return [bytes(g) for g in (match[0], *match.groups())]
+
+
+def remove_manifest(st):
+    """
+    Removes the manifest of the binary with stat result st, if there is one.
+    """
+    try:
+        os.unlink(os.path.join(MANIFESTS, "%d-%d.json" % (st.st_dev, st.st_ino)))
+    except FileNotFoundError:
+        pass
+
+
+def remove_instance(path):
+    """
+    Removes an instance driver. Its manifest is removed as well, unless the
+    binary is hardlinked to a store entry, which shares the manifest.
+    """
+    st = os.stat(path)
+    os.unlink(path)
+    if st.st_nlink == 1:
+        remove_manifest(st)
+
+
+def remove_store_entry(path):
+    """
+    Removes a patched driver from the store, along with its manifest.
+    """
+    st = os.stat(path)
+    os.unlink(path)
+    remove_manifest(st)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+    logger.debug("removed %s from the driver store" % path)
+
+
+def link_or_copy(src, dst):
+    """
+    Makes the file src available at dst, sharing the data where possible.
+    Tries a hardlink first, then a reflink, and falls back to a plain copy.
+
+    Returns the method used: "hardlink", "reflink" or "copy"
+    """
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copyfile(src, dst)
+    shutil.copymode(src, dst)
+    return "copy"
+
 
 class Patcher(object):
-    lock = Lock()
     exe_name = "chromedriver%s"
+    url_download = "https://storage.googleapis.com/chrome-for-testing-public"
 
     platform = sys.platform
     if platform.endswith("win32"):
@@ -42,12 +181,21 @@ class Patcher(object):
         d = "~/.undetected_chromedriver"
     data_path = os.path.abspath(os.path.expanduser(d))
 
+    _metadata_parsed = {}
+
+    # number of patched drivers (one per browser major version) kept side by side,
+    # the least recently used one is removed when exceeded
+    max_registered_drivers = 4
+
     def __init__(
         self,
         executable_path=None,
         force=False,
         version_main: int = 0,
         user_multi_procs=False,
+        platform_name=None,
+        browser_executable_path=None,
+        repository=None,
     ):
         """
         Args:
@@ -57,15 +205,32 @@ class Patcher(object):
                     terminate processes which are holding lock
             version_main: 0 = auto
                 specify main chrome version (rounded, ex: 82)
+            platform_name: None = the platform we are running on
+                download drivers for another platform (ex: win64, mac-arm64)
+            browser_executable_path: None
+                when version_main is not specified, the driver matching
+                the version of this browser is used
+            repository: None = $UC_DRIVER_REPOSITORY or google's endpoints
+                a DriverRepository to get release metadata and drivers from
         """
         self.force = force
         self._custom_exe_path = False
         prefix = "undetected"
         self.user_multi_procs = user_multi_procs
 
+        if not version_main and browser_executable_path:
+            version = browser_version(browser_executable_path)
+            if version:
+                version_main = LooseVersion(version).version[0]
+
         self.is_old_chromedriver = version_main and version_main <= 114
         # Needs to be called before self.exe_name is accessed
         self._set_platform_name()
+        if platform_name:
+            self.platform_name = platform_name
+            self.exe_name = type(self).exe_name % (
+                ".exe" if platform_name.startswith("win") else ""
+            )
 
         if not os.path.exists(self.data_path):
             os.makedirs(self.data_path, exist_ok=True)
@@ -98,8 +263,22 @@ class Patcher(object):
         else:
             self.url_repo = "https://googlechromelabs.github.io/chrome-for-testing"
 
+        self._repository = repository
         self.version_main = version_main
         self.version_full = None
+        # the unpatched driver downloaded by fetch_package
+        self.base_driver_path = DRIVER_PATH
+        # None, or a callable accepting (bytes downloaded, total bytes, bytes per second)
+        self.download_progress = None
+        # seconds spent waiting for other processes to finish provisioning
+        self.lock_wait_time = 0.0
+        # None, or a timing.StartupProfile to record the provisioning phases in
+        self.startup_profile = None
+
+    def _span(self, name, **attrs):
+        if self.startup_profile is None:
+            return contextlib.nullcontext()
+        return self.startup_profile.span(name, **attrs)
 
     def _set_platform_name(self):
         """
@@ -126,14 +305,16 @@ class Patcher(object):
         p = pathlib.Path(self.data_path)
 
         if self.user_multi_procs:
-            with Lock():
+            with FileLock(os.path.join(self.data_path, ".lock")) as lock:
                 files = list(p.rglob("*chromedriver*"))
                 most_recent = max(files, key=lambda f: f.stat().st_mtime)
                 files.remove(most_recent)
                 list(map(lambda f: f.unlink(), files))
-                if self.is_binary_patched(most_recent):
-                    self.executable_path = str(most_recent)
-                    return True
+                patched = self.is_binary_patched(most_recent)
+            self.lock_wait_time += lock.wait_time
+            if patched:
+                self.executable_path = str(most_recent)
+                return True
 
         if executable_path:
             self.executable_path = executable_path
@@ -166,12 +347,26 @@ class Patcher(object):
         except FileNotFoundError:
             pass
 
-        release = self.fetch_release_number()
+        release = self.registered_release() or self.provisioned_release()
+        if not release:
+            with self._span("metadata_fetch"):
+                release = self.fetch_release_number()
         self.version_main = release.version[0]
         self.version_full = release
         # self.unzip_package(self.fetch_package())
-        self.cached_package()
-        return self.patch()
+        if not self._link_registered():
+            # single flight: the first process provisions the driver,
+            # the others wait here and then reuse its result
+            with FileLock(PROVISION_LOCK) as lock:
+                self.register(self.cached_package())
+            self.lock_wait_time += lock.wait_time
+
+        from .collector import DriverCollector
+
+        DriverCollector.schedule()
+        # the instance shares its data with the store entry, which
+        # is patched already. writing to it would alter every instance.
+        return self.is_binary_patched()
 
 
     def driver_binary_in_use(self, path: str = None) -> bool:
@@ -212,8 +407,7 @@ class Patcher(object):
                 pass
 
     def patch(self):
-        self.patch_exe()
-        return self.is_binary_patched()
+        return self.patch_exe()
 
     def fetch_release_number(self):
         """
@@ -223,46 +417,139 @@ class Patcher(object):
             path = f"/latest_release_{self.version_main}"
             path = path.upper()
             logger.debug("getting release number from %s" % path)
-            return LooseVersion(urlopen(self.url_repo + path).read().decode())
+            return LooseVersion(self.repository.get_document(path).strip())
 
         if not self.version_main:
             path = "/last-known-good-versions-with-downloads.json"
             logger.debug("getting release number from %s" % path)
-            with urlopen(self.url_repo + path) as conn:
-                response = conn.read().decode()
-
-            last_versions = json.loads(response)
+            last_versions = self.fetch_metadata_json(path)
             return LooseVersion(last_versions["channels"]["Stable"]["version"])
 
         path = "/latest-versions-per-milestone-with-downloads.json"
         logger.debug("getting release number from %s" % path)
-        with urlopen(self.url_repo + path) as conn:
-            response = conn.read().decode()
-
-        major_versions = json.loads(response)
+        major_versions = self.fetch_metadata_json(path)
         return LooseVersion(major_versions["milestones"][str(self.version_main)]["version"])
 
-    def parse_exe_version(self):
-        with io.open(self.executable_path, "rb") as f:
-            for line in iter(lambda: f.readline(), b""):
-                match = re.search(rb"platform_handle\x00content\x00([0-9.]*)", line)
-                if match:
-                    return LooseVersion(match[1].decode())
+    def provisioned_release(self):
+        """
+        Gets the driver version from the drivers pre-baked by `python -m undetected_chromedriver`,
+        the highest one if version_main is not specified.
+        Returns None when no matching driver was provisioned.
+        """
+        try:
+            with io.open(PROVISIONED, "r", encoding="utf-8") as fh:
+                drivers = json.load(fh)["drivers"]
+        except (OSError, ValueError, KeyError):
+            return None
+        candidates = [
+            LooseVersion(d["version"])
+            for d in drivers
+            if d["platform"] == self.platform_name
+            and d["patched"]
+            and (not self.version_main or d["milestone"] == int(self.version_main))
+            and os.path.exists(os.path.join(_BASE_DRIVER_PATH, d["path"]))
+        ]
+        if candidates:
+            release = max(candidates)
+            logger.debug("using provisioned driver %s" % release)
+            return release
+
+    def provision(self):
+        """
+        Downloads and patches the driver into the store, without creating an instance.
+        Returns a dict describing the verified store entry.
+        """
+        self.version_full = self.fetch_release_number()
+        self.version_main = self.version_full.version[0]
+        patched_path = self.stored_package()
+
+        # verify
+        digest = self.sha256sum(patched_path)
+        if digest != os.path.basename(patched_path):
+            raise IOError("%s is corrupt, sha256 is %s" % (patched_path, digest))
+        patched = self.is_binary_patched(patched_path)
+        self.write_manifest(
+            patched_path, sha256=digest, version=str(self.version_full), patched=patched
+        )
+        return {
+            "milestone": self.version_main,
+            "version": str(self.version_full),
+            "platform": self.platform_name,
+            "path": os.path.relpath(patched_path, _BASE_DRIVER_PATH),
+            "sha256": digest,
+            "patched": patched,
+        }
+
+    @property
+    def repository(self):
+        """
+        The DriverRepository release metadata and drivers are fetched from.
+        """
+        if self._repository is None:
+            cache_dir = os.path.join(self.data_path, "metadata")
+            if os.environ.get("UC_DRIVER_REPOSITORY"):
+                self._repository = repository_from_urls(
+                    os.environ["UC_DRIVER_REPOSITORY"], cache_dir
+                )
+            elif self.is_old_chromedriver:
+                self._repository = HTTPRepository(self.url_repo, cache_dir=cache_dir)
+            else:
+                self._repository = HTTPRepository(
+                    self.url_repo, self.url_download, cache_dir=cache_dir
+                )
+        return self._repository
+
+    @repository.setter
+    def repository(self, repository):
+        self._repository = repository
+
+    def fetch_metadata_json(self, path):
+        """
+        Gets a release-metadata document from the repository, and parses it.
+        The parsed document is kept in memory as long as the response does not change.
+        """
+        key = (repr(self.repository), path)
+        body = self.repository.get_document(path)
+        cached = self._metadata_parsed.get(key)
+        if cached and cached[0] == body:
+            return cached[1]
+        parsed = json.loads(body)
+        self._metadata_parsed[key] = (body, parsed)
+        return parsed
 
-    def fetch_package(self):
+    def parse_exe_version(self):
+        manifest = self.read_manifest(self.executable_path)
+        if manifest and manifest.get("version"):
+            return LooseVersion(manifest["version"])
+        match = _mmap_search(self.executable_path, _VERSION_SCAN)
+        if match:
+            version = match[1].decode()
+            self.write_manifest(self.executable_path, version=version)
+            return LooseVersion(version)
+
+    def fetch_package(self, progress=None):
         """
         Downloads ChromeDriver from source.
+
+        Args:
+            progress: None = use self.download_progress
+                      callable accepting (bytes downloaded, total bytes, bytes per second)
+
+        Returns: path of the downloaded zip file
         """
         zip_name = f"chromedriver_{self.platform_name}.zip"
         if self.is_old_chromedriver:
-            download_url = "%s/%s/%s" % (self.url_repo, self.version_full.vstring, zip_name)
+            path = "%s/%s" % (self.version_full.vstring, zip_name)
         else:
             zip_name = zip_name.replace("_", "-", 1)
-            download_url = "https://storage.googleapis.com/chrome-for-testing-public/%s/%s/%s"
-            download_url %= (self.version_full.vstring, self.platform_name, zip_name)
+            path = "%s/%s/%s" % (self.version_full.vstring, self.platform_name, zip_name)
 
-        logger.debug("downloading from %s" % download_url)
-        return urlretrieve(download_url)[0]
+        logger.debug("downloading %s from %r" % (path, self.repository))
+        return self.repository.download(
+            path,
+            self.base_driver_path + ".zip",
+            progress or self.download_progress,
+        )
 
     @staticmethod
     def force_kill_instances(exe_name):
@@ -287,60 +574,325 @@ class Patcher(object):
         """
         executable_path = executable_path or self.executable_path
         try:
-            with io.open(executable_path, "rb") as fh:
-                return fh.read().find(b"undetected chromedriver") != -1
+            manifest = self.read_manifest(executable_path)
+            if manifest and manifest.get("patched") is not None:
+                return manifest["patched"]
+            patched = _mmap_search(executable_path, _PATCH_SCAN_MARKER) is not None
         except FileNotFoundError:
             return False
+        self.write_manifest(executable_path, patched=patched)
+        return patched
+
+    @staticmethod
+    def _manifest_path(st):
+        return os.path.join(MANIFESTS, "%d-%d.json" % (st.st_dev, st.st_ino))
 
-    def patch_exe(self):
+    @classmethod
+    def read_manifest(cls, path):
+        """
+        Returns the manifest recorded for the binary at path,
+        or None when there is none or the file changed since.
+
+        Manifests are keyed by inode, so hardlinked instances
+        share the manifest of their store entry.
+        """
+        st = os.stat(path)
+        try:
+            with io.open(cls._manifest_path(st), "r") as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if (manifest.get("inode"), manifest.get("size"), manifest.get("mtime")) != (
+            st.st_ino,
+            st.st_size,
+            st.st_mtime_ns,
+        ):
+            return None
+        return manifest
+
+    @classmethod
+    def write_manifest(cls, path, **fields):
+        """
+        Records fields (sha256, version, patched) for the binary at path,
+        merged into its manifest if that is still valid.
+        """
+        st = os.stat(path)
+        manifest = cls.read_manifest(path) or {}
+        manifest.update(fields)
+        manifest.update(inode=st.st_ino, size=st.st_size, mtime=st.st_mtime_ns)
+        manifest_path = cls._manifest_path(st)
+        tmp_path = "%s.%s.tmp" % (manifest_path, uuid4().hex)
+        try:
+            with io.open(tmp_path, "w") as fh:
+                json.dump(manifest, fh)
+            os.replace(tmp_path, manifest_path)
+        except OSError as e:
+            logger.debug("could not write manifest for %s: %s" % (path, e))
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        return manifest
+
+    @staticmethod
+    def sha256sum(path, chunk_size=1 << 20):
+        digest = hashlib.sha256()
+        with io.open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def patch_exe(self, executable_path=None):
+        """
+        Patches the injection code block in place.
+
+        The file is memory-mapped and scanned once for both the injection block
+        and the patch marker, only the matched byte ranges are rewritten.
+
+        Returns True when the binary is patched afterwards, False otherwise.
+        """
+        executable_path = executable_path or self.executable_path
         start = time.perf_counter()
-        logger.info("patching driver executable %s" % self.executable_path)
-        with io.open(self.executable_path, "r+b") as fh:
-            content = fh.read()
-            match_injected_codeblock = re.search(rb"\{window\.cdc.*?;\}", content)
-            if match_injected_codeblock:
-                target_bytes = match_injected_codeblock[0]
-                new_target_bytes = (
-                    b'{console.log("undetected chromedriver 1337!")}'.ljust(
-                        len(target_bytes), b" "
-                    )
-                )
-                new_content = content.replace(target_bytes, new_target_bytes)
-                if new_content == content:
-                    logger.warning(
-                        "something went wrong patching the driver binary. could not find injection code block"
-                    )
-                else:
+        logger.info("patching driver executable %s" % executable_path)
+        patched = False
+        with io.open(executable_path, "r+b") as fh:
+            try:
+                mm = mmap.mmap(fh.fileno(), 0)
+            except ValueError:
+                # empty file
+                logger.warning("cannot patch empty file %s" % executable_path)
+                return False
+            with mm:
+                matches = list(_PATCH_SCAN.finditer(mm))
+                for match in matches:
+                    if match[0] == _PATCH_MARKER:
+                        patched = True
+                        continue
+                    target_bytes = match[0]
+                    if len(_PATCH_BLOCK) > len(target_bytes):
+                        logger.warning(
+                            "injection code block too short to patch in place: %s"
+                            % target_bytes
+                        )
+                        continue
+                    new_target_bytes = _PATCH_BLOCK.ljust(len(target_bytes), b" ")
+                    mm[match.start() : match.end()] = new_target_bytes
+                    patched = True
                     logger.debug(
                         "found block:\n%s\nreplacing with:\n%s"
                         % (target_bytes, new_target_bytes)
                     )
-                fh.seek(0)
-                fh.write(new_content)
+                if not matches:
+                    logger.warning(
+                        "something went wrong patching the driver binary. could not find injection code block"
+                    )
+                mm.flush()
+        self.write_manifest(executable_path, patched=patched)
         logger.debug(
             "patching took us {:.2f} seconds".format(time.perf_counter() - start)
         )
+        return patched
 
     def cached_package(self):
-        if not os.path.exists(DRIVER_PATH):
-            path = self.fetch_package()
-            shutil.copy2(path, DRIVER_PATH + ".zip")
-            os.remove(path)
-            self.unzip_package_main()
-        instance_id = uuid4().hex
+        patched_path = self.stored_package()
+        self._link_instance(patched_path)
+        return patched_path
+
+    def _link_instance(self, patched_path):
+        # named after the owning process, see DriverCollector
+        instance_id = "%d_%s" % (os.getpid(), uuid4().hex)
         self.executable_path = os.path.join(INSTANCE_DRIVERS, instance_id)
-        shutil.copyfile(DRIVER_PATH, os.path.join(INSTANCE_DRIVERS, self.executable_path))
-        os.chmod(self.executable_path, 0o755)
-        return DRIVER_PATH
+        method = link_or_copy(patched_path, self.executable_path)
+        logger.debug("created instance %s (%s)" % (self.executable_path, method))
 
-    def unzip_package_main(self):
-        with zipfile.ZipFile(DRIVER_PATH + ".zip", mode="r") as zf:
+    def _link_registered(self):
+        """
+        Links an instance to the registered driver for version_full, without
+        taking PROVISION_LOCK, if it is the most recently used driver already.
+        Registering it again would not change the registry then, and registered
+        drivers are not collected, so linking it needs no lock.
+
+        Returns False when the driver has to be provisioned and registered instead.
+        """
+        registry = self.read_registry()
+        entry = registry.get(self._registry_key())
+        if not entry or entry["version"] != str(self.version_full):
+            return False
+        if max(e["last_used"] for e in registry.values()) > entry["last_used"]:
+            return False
+        try:
+            self._link_instance(os.path.join(_BASE_DRIVER_PATH, entry["path"]))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stored_package(self):
+        """
+        Returns the patched driver for (self.version_full, self.platform_name) from the store.
+        When missing, it is downloaded and patched into the store first.
+        """
+        patched_path = self.find_patched_package()
+        if patched_path:
+            return patched_path
+        self.base_driver_path = os.path.join(
+            _BASE_DRIVER_PATH,
+            "downloads",
+            "%s_%s" % (self.version_full, self.platform_name),
+        )
+        os.makedirs(os.path.dirname(self.base_driver_path), exist_ok=True)
+        with FileLock(self.base_driver_path + ".lock"):
+            patched_path = self.find_patched_package()
+            if not patched_path:
+                zip_path = self.base_driver_path + ".zip"
+                if not os.path.exists(zip_path):
+                    with self._span("download", version=str(self.version_full)):
+                        self.fetch_package()
+                patched_path = self.patched_package(zip_path)
+                os.unlink(zip_path)
+        return patched_path
+
+    def _registry_key(self):
+        return "%s_%s" % (self.platform_name, self.version_main)
+
+    @staticmethod
+    def read_registry():
+        try:
+            with io.open(REGISTRY, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def registered_release(self):
+        """
+        Gets the driver version registered for version_main, if any.
+        Unlike fetch_release_number, this needs no network i/o.
+        """
+        if not self.version_main:
+            return None
+        entry = self.read_registry().get(self._registry_key())
+        if entry and os.path.exists(os.path.join(_BASE_DRIVER_PATH, entry["path"])):
+            logger.debug("using registered driver %s" % entry["version"])
+            return LooseVersion(entry["version"])
+
+    def register(self, patched_path):
+        """
+        Registers patched_path as the driver for version_main and marks it as used.
+
+        Drivers for several browser major versions are kept side by side. When there
+        are more than max_registered_drivers, the least recently used are removed.
+        Must be called while holding PROVISION_LOCK.
+        """
+        registry = self.read_registry()
+        key = self._registry_key()
+        registry[key] = {
+            "version": str(self.version_full),
+            "path": os.path.relpath(patched_path, _BASE_DRIVER_PATH),
+            "last_used": time.time(),
+        }
+        by_age = sorted(registry, key=lambda k: registry[k]["last_used"])
+        for old_key in by_age[: max(0, len(registry) - self.max_registered_drivers)]:
+            old_path = os.path.join(_BASE_DRIVER_PATH, registry.pop(old_key)["path"])
+            logger.debug("unregistering driver %s" % old_key)
+            try:
+                # still linked by running instances? the collector removes it later
+                if os.stat(old_path).st_nlink == 1:
+                    remove_store_entry(old_path)
+            except OSError:
+                pass
+        tmp_path = "%s.%s.tmp" % (REGISTRY, uuid4().hex)
+        with io.open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(registry, fh, indent=2)
+        os.replace(tmp_path, REGISTRY)
+
+    @property
+    def store_dir(self):
+        return os.path.join(
+            PATCHED_DRIVERS, "%s_%s" % (self.version_full, self.platform_name)
+        )
+
+    def find_patched_package(self):
+        """
+        Returns the patched driver for (self.version_full, self.platform_name)
+        from the store, or None if there is none yet.
+        """
+        try:
+            names = os.listdir(self.store_dir)
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if not name.startswith("."):
+                return os.path.join(self.store_dir, name)
+
+    def patched_package(self, zip_path=None):
+        """
+        Returns the patched driver from the store, patching the base driver into it when missing.
+
+        The store is keyed by (driver version, platform, sha256 of the patched bytes),
+        laid out as PATCHED_DRIVERS/<version>_<platform>/<sha256>. The base driver is
+        only patched once, instances are linked to the resulting store entry.
+
+        Args:
+            zip_path: driver package to extract the base driver from, straight into
+                      the store. None = copy it from self.base_driver_path
+        """
+        patched_path = self.find_patched_package()
+        if patched_path:
+            return patched_path
+        store_dir = self.store_dir
+        os.makedirs(store_dir, exist_ok=True, mode=0o755)
+
+        tmp_path = os.path.join(store_dir, ".%s.tmp" % uuid4().hex)
+        try:
+            if zip_path:
+                with self._span("unzip"):
+                    self._extract_driver(zip_path, tmp_path)
+            else:
+                shutil.copyfile(self.base_driver_path, tmp_path)
+            with self._span("patch"):
+                patched = self.patch_exe(tmp_path)
+            os.chmod(tmp_path, 0o755)
+            digest = self.sha256sum(tmp_path)
+            patched_path = os.path.join(store_dir, digest)
+            # patching is deterministic, so concurrent writers produce the same entry
+            os.replace(tmp_path, patched_path)
+            self.write_manifest(
+                patched_path,
+                sha256=digest,
+                version=str(self.version_full),
+                patched=patched,
+            )
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        logger.debug("stored patched driver %s" % patched_path)
+        return patched_path
+
+    def _extract_driver(self, zip_path, target):
+        """
+        Extracts the chromedriver member of zip_path to target.
+        """
+        with zipfile.ZipFile(zip_path, mode="r") as zf:
             for f in zf.namelist():
-                if f.split("/")[1] == "chromedriver":
-                    with zf.open(f) as fs, open(DRIVER_PATH, "wb") as ft:
-                        shutil.copyfileobj(fs, ft)
-                    break
-        os.unlink(DRIVER_PATH + ".zip")
+                if f.rsplit("/", 1)[-1] == self.exe_name:
+                    with zf.open(f) as fs, open(target, "wb") as ft:
+                        shutil.copyfileobj(fs, ft, 1 << 20)
+                    return
+        raise FileNotFoundError("no %s found in %s" % (self.exe_name, zip_path))
+
+    def unzip_package_main(self):
+        """
+        Extracts the chromedriver member to self.base_driver_path, atomically.
+        """
+        zip_path = self.base_driver_path + ".zip"
+        tmp_path = "%s.%s.tmp" % (self.base_driver_path, uuid4().hex)
+        try:
+            self._extract_driver(zip_path, tmp_path)
+            os.chmod(tmp_path, 0o755)
+            os.replace(tmp_path, self.base_driver_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        os.unlink(zip_path)
 
     def __repr__(self):
         return "{0:s}({1:s})".format(
@@ -349,22 +901,15 @@ class Patcher(object):
         )
 
     def __del__(self):
-        if self._custom_exe_path:
+        if self._custom_exe_path or self.user_multi_procs:
             return
-        else:
-            timeout = 3
-            t = time.monotonic()
-            now = lambda: time.monotonic()
-            while now() - t > timeout:
-                # we don't want to wait until the end of time
-                try:
-                    if self.user_multi_procs:
-                        break
-                    os.unlink(self.executable_path)
-                    logger.debug("successfully unlinked %s" % self.executable_path)
-                    break
-                except (OSError, RuntimeError, PermissionError):
-                    time.sleep(0.01)
-                    continue
-                except FileNotFoundError:
-                    break
+        if os.path.dirname(self.executable_path) != INSTANCE_DRIVERS:
+            return
+        try:
+            remove_instance(self.executable_path)
+            logger.debug("successfully unlinked %s" % self.executable_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # still in use, the DriverCollector removes it once this process ends
+            logger.debug("could not unlink %s: %s" % (self.executable_path, e))
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+import asyncio
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .connection import Connection
+from . import readiness
+from .reactor import ReactorHub
+
+
+logger = logging.getLogger(__name__)
+
+
+def _origin(url):
+    try:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return None
+        if parts.port:
+            return "%s://%s:%d" % (parts.scheme, parts.hostname, parts.port)
+    except ValueError:
+        return None
+    return "%s://%s" % (parts.scheme, parts.hostname)
+
+
+class OriginTracker(object):
+    """
+    Records the origins of all targets (tabs, frames, workers) of a browser,
+    so the storage of each of them can be cleared. The targets are followed
+    using the browser's Target events, on a loop of the ReactorHub.
+    """
+
+    def __init__(self, debugger_address, hub=None, timeout=readiness.DEFAULT_TIMEOUT):
+        self.host, self.port = debugger_address.split(":")
+        self.hub = hub or ReactorHub.default()
+        self.lock = threading.Lock()
+        self.origins = set()
+        self.connection = None
+        self.loop = self.hub.register(self)
+        try:
+            asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _start(self):
+        version = await readiness.get_json_async(self.host, self.port, "/json/version")
+        self.connection = Connection(version["webSocketDebuggerUrl"])
+        self.connection.add_listener("Target.targetCreated", self._on_target)
+        self.connection.add_listener("Target.targetInfoChanged", self._on_target)
+        # also reports the targets which exist already
+        await self.connection.send("Target.setDiscoverTargets", {"discover": True})
+
+    def _on_target(self, message):
+        origin = _origin(message["params"]["targetInfo"].get("url", ""))
+        if origin:
+            with self.lock:
+                self.origins.add(origin)
+
+    def take(self):
+        """
+        Returns the origins recorded since the last call.
+        """
+        with self.lock:
+            origins, self.origins = self.origins, set()
+        return origins
+
+    def close(self):
+        if self.connection is not None:
+            asyncio.run_coroutine_threadsafe(self.connection.close(), self.loop)
+        self.hub.unregister(self)
+
+
+class BrowserPool(object):
+    """
+    Keeps a number of warm Chrome instances, so short jobs skip the startup cost.
+
+        pool = uc.BrowserPool(size=4, headless=True)
+
+        with pool.browser() as driver:
+            driver.get("https://nowsecure.nl")
+
+        pool.close()
+
+    On checkin, extra tabs are closed, cookies, cache and the storage of the
+    origins visited are cleared and the browser navigates to about:blank. A browser is replaced by a fresh one after
+    max_uses checkouts or max_age seconds, or when resetting it fails.
+    """
+
+    def __init__(
+        self,
+        size=2,
+        max_uses=50,
+        max_age=600,
+        prefill=True,
+        factory=None,
+        **chrome_kwargs,
+    ):
+        """
+        Parameters
+        ----------
+        size: int, default 2
+            maximum number of browsers, idle and checked out together
+
+        max_uses: int, default 50, None = unlimited
+            checkouts after which a browser is recycled
+
+        max_age: float, default 600, None = unlimited
+            seconds after which a browser is recycled
+
+        prefill: bool, default True
+            start all browsers in the background right away
+
+        factory: callable, optional
+            returns a new browser. defaults to uc.Chrome(**chrome_kwargs)
+
+        chrome_kwargs:
+            arguments for uc.Chrome. since ChromeOptions cannot be reused,
+            pass `options` as a callable returning a new ChromeOptions object.
+        """
+        options = chrome_kwargs.get("options")
+        if options is not None and not callable(options):
+            raise ValueError(
+                "you cannot reuse the ChromeOptions object, pass a callable "
+                "which returns a new ChromeOptions object instead"
+            )
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.factory = factory
+        self.chrome_kwargs = chrome_kwargs
+
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        if prefill:
+            for _ in range(size):
+                self._spawn()
+
+    def _create(self):
+        if self.factory:
+            driver = self.factory()
+        else:
+            from . import Chrome
+
+            kwargs = dict(self.chrome_kwargs)
+            if callable(kwargs.get("options")):
+                kwargs["options"] = kwargs["options"]()
+            driver = Chrome(**kwargs)
+        driver._pool_created = time.monotonic()
+        driver._pool_uses = 0
+        try:
+            driver._pool_origins = OriginTracker(driver.options.debugger_address)
+        except Exception as e:
+            # storage is cleared for the origins with cookies only
+            logger.debug("could not track origins of %s: %s" % (driver, e))
+            driver._pool_origins = None
+        return driver
+
+    def _spawn(self):
+        """
+        Starts a browser in the background, which is added to the idle browsers.
+        """
+        with self._cond:
+            if self._closed or self._total >= self.size:
+                return
+            self._total += 1
+        threading.Thread(target=self._spawn_worker, daemon=True).start()
+
+    def _spawn_worker(self):
+        try:
+            driver = self._create()
+        except Exception as e:
+            logger.warning("could not start browser for pool: %s" % e)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify_all()
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.append(driver)
+                self._cond.notify_all()
+                return
+            self._total -= 1
+        self._quit(driver)
+
+    def checkout(self, timeout=None):
+        """
+        Returns a browser from the pool, waiting at most timeout seconds
+        for one to become available.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("pool is closed")
+                if self._idle:
+                    driver = self._idle.pop()
+                    break
+                if self._total < self.size:
+                    # none warm yet, start one in this thread
+                    self._total += 1
+                    driver = None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("no browser available in the pool")
+                self._cond.wait(remaining)
+        if driver is None:
+            try:
+                driver = self._create()
+            except BaseException:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify_all()
+                raise
+        driver._pool_uses += 1
+        return driver
+
+    def checkin(self, driver, discard=False):
+        """
+        Returns a browser to the pool, resetting its state, or replacing
+        it when it is due for recycling, or `discard` is set.
+        """
+        if not discard and not self._expired(driver):
+            try:
+                self.reset(driver)
+            except Exception as e:
+                logger.debug("could not reset browser, replacing it: %s" % e)
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            if not discard and not self._closed:
+                self._idle.append(driver)
+                self._cond.notify_all()
+                return
+            self._total -= 1
+            self._cond.notify_all()
+        threading.Thread(target=self._quit, args=(driver,), daemon=True).start()
+        self._spawn()
+
+    @contextmanager
+    def browser(self, timeout=None):
+        """
+        Checks out a browser for the duration of the with block.
+        """
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        finally:
+            self.checkin(driver)
+
+    def _expired(self, driver):
+        if self.max_uses is not None and driver._pool_uses >= self.max_uses:
+            return True
+        if (
+            self.max_age is not None
+            and time.monotonic() - driver._pool_created >= self.max_age
+        ):
+            return True
+        return False
+
+    @staticmethod
+    def reset(driver):
+        """
+        Closes all but the first tab, clears cookies, cache and the storage
+        of the origins visited, and navigates to about:blank.
+        """
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        tracker = getattr(driver, "_pool_origins", None)
+        origins = tracker.take() if tracker else set()
+        # covers same-process frames, which are no targets of their own
+        for cookie in driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]:
+            domain = cookie["domain"].lstrip(".")
+            origins.update(("http://" + domain, "https://" + domain))
+        for origin in sorted(origins):
+            driver.execute_cdp_cmd(
+                "Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"}
+            )
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        try:
+            driver.execute_script(
+                "window.localStorage && localStorage.clear();"
+                "window.sessionStorage && sessionStorage.clear();"
+            )
+        except Exception:
+            # storage is not accessible on some pages, like chrome:// urls
+            pass
+        driver.get("about:blank")
+
+    @staticmethod
+    def _quit(driver):
+        tracker = getattr(driver, "_pool_origins", None)
+        if tracker is not None:
+            tracker.close()
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug("error while quitting pooled browser: %s" % e)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    @property
+    def total(self):
+        return self._total
+
+    def close(self):
+        """
+        Quits all idle browsers. Browsers checked out are quit on checkin.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for driver in idle:
+            self._quit(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "{0:s}(size={1:d}, idle={2:d}, total={3:d})".format(
+            self.__class__.__name__, self.size, self.idle, self.total
+        )
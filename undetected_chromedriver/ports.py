@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Port reservations shared by all uc processes on a host.
+
+Picking a "free" port by binding to port 0 and closing the socket again is
+racy: when many browsers start at once, two of them may be handed the same
+port before either has bound it. Instead, ports are reserved in a registry
+folder (<Patcher.data_path>/ports), one file per port holding the pid of the
+owning process, before they are checked for being free.
+Reservations of processes which are gone are reclaimed.
+
+    port = allocator.reserve()
+    ...
+    allocator.release(port)
+"""
+
+import errno
+import io
+import logging
+import os
+import random
+import socket
+import threading
+
+from .dprocess import pid_alive
+from .locking import FileLock
+
+
+logger = logging.getLogger(__name__)
+
+
+class PortAllocator(object):
+    """
+    Reserves ports from [low, high), a range outside the ephemeral ports
+    handed out by the os on linux, mac and windows.
+    """
+
+    low = 20000
+    high = 30000
+
+    def __init__(self, path=None, low=None, high=None):
+        """
+        Args:
+            path: None = <Patcher.data_path>/ports
+                  folder holding the reservations
+            low: first port of the range
+            high: end of the range (exclusive)
+        """
+        self._path = path
+        if low is not None:
+            self.low = low
+        if high is not None:
+            self.high = high
+        # ports reserved by this process
+        self.reserved = set()
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path is None:
+            from .patcher import Patcher
+
+            return os.path.join(Patcher.data_path, "ports")
+        return self._path
+
+    def _entry(self, port):
+        return os.path.join(self.path, str(port))
+
+    def _owner(self, port):
+        try:
+            with io.open(self._entry(port), "r") as fh:
+                return int(fh.read().strip() or 0)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            return 0
+
+    def reserve(self, host="127.0.0.1"):
+        """
+        Reserves a port which is free on host, and returns it.
+        Raises OSError when the whole range is taken.
+        """
+        size = self.high - self.low
+        # start at a random offset, so concurrent processes rarely contend
+        offset = random.randrange(size)
+        with self._lock, FileLock(os.path.join(self.path, ".lock")):
+            for i in range(size):
+                port = self.low + (offset + i) % size
+                owner = self._owner(port)
+                if owner is not None:
+                    if owner == os.getpid() or pid_alive(owner):
+                        continue
+                    logger.debug(
+                        "reclaiming port %d of process %d, which is gone" % (port, owner)
+                    )
+                if not port_is_free(host, port):
+                    continue
+                with io.open(self._entry(port), "w") as fh:
+                    fh.write(str(os.getpid()))
+                self.reserved.add(port)
+                logger.debug("reserved port %d" % port)
+                return port
+        raise OSError(
+            errno.EADDRINUSE, "no free port in range %d-%d" % (self.low, self.high)
+        )
+
+    def release(self, port):
+        """
+        Releases a port reserved by this process.
+        """
+        with self._lock:
+            self.reserved.discard(port)
+            if self._owner(port) != os.getpid():
+                return
+            try:
+                os.unlink(self._entry(port))
+                logger.debug("released port %d" % port)
+            except FileNotFoundError:
+                pass
+
+    def reclaim(self):
+        """
+        Removes the reservations of processes which are gone.
+        Returns the reclaimed ports.
+        """
+        reclaimed = []
+        with self._lock, FileLock(os.path.join(self.path, ".lock")):
+            for name in os.listdir(self.path):
+                if not name.isdigit():
+                    continue
+                owner = self._owner(name)
+                if owner is None or pid_alive(owner):
+                    continue
+                try:
+                    os.unlink(self._entry(name))
+                    reclaimed.append(int(name))
+                except FileNotFoundError:
+                    pass
+        return reclaimed
+
+    def __repr__(self):
+        return "{0:s}({1:s}, {2:d}-{3:d})".format(
+            self.__class__.__name__, self.path, self.low, self.high
+        )
+
+
+def port_is_free(host, port):
+    """
+    Returns True when port can be bound on host right now.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind((host, port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+allocator = PortAllocator()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from uuid import uuid4
+
+from distutils.version import LooseVersion
+
+from .discovery import browser_version
+from .locking import FileLock
+from .options import ChromeOptions
+from .patcher import _reflink
+from .patcher import IS_POSIX
+from .patcher import Patcher
+from .patcher import link_or_copy
+
+
+logger = logging.getLogger(__name__)
+
+# chrome never writes to these after creating them, so clones share them with
+# the template as hardlinks: leveldb tables and the payloads of installed
+# extensions (in versioned folders, replaced on update). every other file
+# (sqlite databases, leveldb logs, blockfile caches, preferences, sessions,
+# "Visited Links", ...) may be rewritten in place, and is copied or reflinked.
+_IMMUTABLE_SUFFIXES = (".ldb", ".sst")
+_IMMUTABLE_DIRS = ("Extensions",)
+# runtime files of a running browser, never part of a template
+_SKIP_PREFIXES = ("Singleton", ".org.chromium.")
+
+
+def is_immutable(rel_path):
+    """
+    Returns True for profile files chrome never modifies in place,
+    given their path relative to the profile folder.
+    """
+    if rel_path.endswith(_IMMUTABLE_SUFFIXES):
+        return True
+    parts = os.path.normpath(rel_path).split(os.sep)
+    return any(d in parts[:-1] for d in _IMMUTABLE_DIRS)
+
+
+def prefs_to_nested(prefs):
+    """
+    Turns a {dotted.key: value} prefs dict into a nested dict.
+    """
+    nested = {}
+    for key, value in (prefs or {}).items():
+        nested = ChromeOptions._merge_nested(
+            nested, ChromeOptions._undot_key(key, value)
+        )
+    return nested
+
+
+class ProfileTemplate(object):
+    """
+    A pre-initialized browser profile, which new profiles are cloned from.
+
+    A template is built once per (browser version, prefs) by starting the browser
+    on an empty profile and shutting it down again. Templates of other browser
+    versions are removed then. Clones share the files chrome never modifies in
+    place (see is_immutable) with the template as hardlinks, and get their own
+    copy (or reflink) of the others.
+
+        template = ProfileTemplate("/usr/bin/google-chrome", prefs={"intl.accept_languages": "nl"})
+        user_data_dir = template.clone()
+    """
+
+    # seconds to wait for the browser to initialize the template profile
+    init_timeout = 30
+
+    def __init__(self, browser_executable_path, prefs=None, root=None):
+        """
+        Args:
+            browser_executable_path: browser to build the template with
+            prefs: None, or dict of (dotted) preference keys and values
+                   to be written into the template
+            root: None = <Patcher.data_path>/profile_templates
+                  folder holding the templates
+        """
+        self.browser_executable_path = browser_executable_path
+        self.prefs = prefs_to_nested(prefs)
+        self.root = root or os.path.join(Patcher.data_path, "profile_templates")
+        self.version = browser_version(browser_executable_path) or "unknown"
+        prefs_hash = hashlib.sha1(
+            json.dumps(self.prefs, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        self.path = os.path.join(self.root, "%s_%s" % (self.version, prefs_hash))
+
+    @property
+    def exists(self):
+        return os.path.isdir(self.path)
+
+    def build(self):
+        """
+        Builds the template, unless it exists already.
+        Returns the template path.
+        """
+        if self.exists:
+            return self.path
+        os.makedirs(self.root, exist_ok=True)
+        with FileLock(self.path + ".lock"):
+            if self.exists:
+                return self.path
+            tmp_path = "%s.%s.tmp" % (self.path, uuid4().hex)
+            try:
+                start = time.perf_counter()
+                self._initialize(tmp_path)
+                self._write_prefs(tmp_path)
+                os.replace(tmp_path, self.path)
+                logger.debug(
+                    "built profile template %s in %.2f seconds"
+                    % (self.path, time.perf_counter() - start)
+                )
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        self.prune()
+        return self.path
+
+    def prune(self):
+        """
+        Removes the templates of other browser versions, except those being built.
+        """
+        if self.version == "unknown":
+            return
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if (
+                name.startswith(self.version + "_")
+                or name.endswith(".tmp")
+                or not os.path.isdir(path)
+            ):
+                continue
+            lock = FileLock(path + ".lock", timeout=0)
+            try:
+                lock.acquire()
+            except TimeoutError:
+                continue
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                lock.release()
+            try:
+                os.unlink(path + ".lock")
+            except OSError:
+                pass
+            logger.debug("removed profile template %s" % path)
+
+    def _initialize(self, path):
+        """
+        Lets the browser create its profile files in path.
+        """
+        major = LooseVersion(self.version).version[0] if self.version[0].isdigit() else 0
+        args = [
+            self.browser_executable_path,
+            "--user-data-dir=%s" % path,
+            "--headless=new" if not major or major >= 109 else "--headless",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--no-sandbox",
+            "--test-type",
+            "about:blank",
+        ]
+        browser = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=IS_POSIX,
+        )
+        prefs_file = os.path.join(path, "Default", "Preferences")
+        deadline = time.monotonic() + self.init_timeout
+        try:
+            while not os.path.exists(prefs_file):
+                if browser.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(
+                        "browser %s did not initialize profile %s"
+                        % (self.browser_executable_path, path)
+                    )
+                time.sleep(0.1)
+        finally:
+            # a graceful shutdown, so the browser flushes its state to disk
+            browser.terminate()
+            try:
+                browser.wait(10)
+            except subprocess.TimeoutExpired:
+                browser.kill()
+                browser.wait()
+
+    def _write_prefs(self, path):
+        prefs_file = os.path.join(path, "Default", "Preferences")
+        try:
+            with io.open(prefs_file, encoding="latin1", mode="r") as fs:
+                config = json.load(fs)
+        except (OSError, ValueError):
+            config = {}
+        config = ChromeOptions._merge_nested(config, self.prefs)
+        # prevent the tab-restore nag in every clone
+        config.setdefault("profile", {})["exit_type"] = None
+        os.makedirs(os.path.dirname(prefs_file), exist_ok=True)
+        with io.open(prefs_file, encoding="latin1", mode="w") as fs:
+            json.dump(config, fs)
+
+    def clone(self, target=None):
+        """
+        Creates a new profile from the template, building the template first if needed.
+
+        Args:
+            target: None = a new temporary folder
+                    folder to create the profile in, which must not exist or be empty
+
+        Returns: the profile path
+        """
+        self.build()
+        temporary = not target
+        target = target or tempfile.mkdtemp()
+        start = time.perf_counter()
+        try:
+            for dirpath, dirnames, filenames in os.walk(self.path):
+                rel = os.path.relpath(dirpath, self.path)
+                target_dir = os.path.normpath(os.path.join(target, rel))
+                os.makedirs(target_dir, exist_ok=True)
+                for name in filenames:
+                    if name.startswith(_SKIP_PREFIXES):
+                        continue
+                    src = os.path.join(dirpath, name)
+                    if os.path.islink(src):
+                        continue
+                    dst = os.path.join(target_dir, name)
+                    if is_immutable(os.path.join(rel, name)):
+                        link_or_copy(src, dst)
+                    elif not _reflink(src, dst):
+                        shutil.copyfile(src, dst)
+        except BaseException:
+            if temporary:
+                shutil.rmtree(target, ignore_errors=True)
+            raise
+        logger.debug(
+            "cloned profile template %s to %s in %.3f seconds"
+            % (self.path, target, time.perf_counter() - start)
+        )
+        return os.path.normpath(target)
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(self.__class__.__name__, self.path)
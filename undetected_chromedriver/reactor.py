@@ -2,27 +2,172 @@
 # this module is part of undetected_chromedriver
 
 import asyncio
-import json
+import concurrent.futures
 import logging
+import os
 import threading
 
+from .connection import CDPError
+from .connection import Connection
+from .dispatch import Dispatcher
+from .dispatch import check_options
+from . import readiness
+
 
 logger = logging.getLogger(__name__)
 
+# domains enabled for a "*" handler
+WILDCARD_DOMAINS = ("Network", "Page")
+# devtools domains with events, by lowercase name, for handlers registered
+# like "network.requestWillBeSent"
+DOMAINS = {
+    d.lower(): d
+    for d in (
+        "Accessibility", "Animation", "Audits", "Autofill", "BackgroundService",
+        "Browser", "CSS", "CacheStorage", "Cast", "Console", "DOM", "DOMStorage",
+        "Database", "Debugger", "DeviceAccess", "Emulation", "FedCm", "Fetch",
+        "HeapProfiler", "IndexedDB", "Inspector", "LayerTree", "Log", "Media",
+        "Network", "Overlay", "Page", "Performance", "PerformanceTimeline",
+        "Preload", "Profiler", "Runtime", "Security", "ServiceWorker", "Storage",
+        "Target", "Tethering", "Tracing", "WebAudio", "WebAuthn",
+    )
+}
 
-class Reactor(threading.Thread):
-    def __init__(self, driver: "Chrome"):
-        super().__init__()
 
-        self.driver = driver
+def canonical_domain(domain):
+    """
+    Returns the domain as devtools spells it ("domstorage" -> "DOMStorage").
+    Raises ValueError for unknown domains which are not capitalized either.
+    """
+    if domain.lower() in DOMAINS:
+        return DOMAINS[domain.lower()]
+    if not domain[:1].isupper():
+        raise ValueError("unknown devtools domain %r" % domain)
+    return domain
+
+
+class _LoopThread(threading.Thread):
+    def __init__(self, name):
+        super().__init__(name=name, daemon=True)
         self.loop = asyncio.new_event_loop()
+        self.reactors = set()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class ReactorHub(object):
+    """
+    Event loops shared by the Reactors of a process, each in a daemon thread.
+
+    Up to `size` loops are started as Reactors register, a Reactor is put on
+    the loop with the fewest Reactors. The size of the process wide hub is
+    taken from $UC_REACTOR_LOOPS (default 1), and can be changed at runtime:
+
+        ReactorHub.default().size = 4
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, size=1):
+        self.size = size
+        self.lock = threading.Lock()
+        self.threads = []
+
+    @classmethod
+    def default(cls):
+        """
+        The process wide hub.
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(int(os.environ.get("UC_REACTOR_LOOPS") or 1))
+            return cls._default
+
+    def register(self, reactor):
+        """
+        Assigns reactor (or another user of a loop, like pool.OriginTracker)
+        to a loop, and returns the loop.
+        """
+        with self.lock:
+            if len(self.threads) < max(1, self.size):
+                thread = _LoopThread("ReactorHub-%d" % len(self.threads))
+                thread.start()
+                self.threads.append(thread)
+            thread = min(self.threads, key=lambda t: len(t.reactors))
+            thread.reactors.add(reactor)
+            return thread.loop
+
+    def unregister(self, reactor):
+        with self.lock:
+            for thread in self.threads:
+                thread.reactors.discard(reactor)
+
+    @property
+    def reactors(self):
+        with self.lock:
+            return sum(len(t.reactors) for t in self.threads)
+
+    def __repr__(self):
+        return "{0:s}(loops={1:d}, reactors={2:d})".format(
+            self.__class__.__name__, len(self.threads), self.reactors
+        )
+
+
+class Reactor(object):
+    """
+    Delivers the devtools events of the browser's pages to the registered handlers.
+
+    The events are pushed over a devtools websocket of the browser, instead of
+    being polled from chromedriver's performance log. Every page, including
+    tabs and popups opened later, is attached to as a session of that
+    websocket (Target.setAutoAttach), its events carry the "sessionId" of the
+    page. Only the domains which have handlers are enabled. The Reactor runs
+    on a loop of a ReactorHub, shared with the Reactors of other drivers,
+    until it is stopped. When the connection is lost, the browser's websocket
+    url is looked up again and the pages are attached to again.
+
+    Each handler has its own queue and workers (see dispatch.py), so a slow
+    or failing handler does not hold up the others. Handlers which are plain
+    functions run on the Reactor's own threads (up to max_workers), not on
+    those shared by the other Reactors of the loop.
+    """
+
+    # events received but not yet handed to the handlers' queues, at most
+    max_pending = 10000
+    # threads running the handlers which are plain functions, at most
+    max_workers = 4
+
+    def __init__(self, driver: "Chrome", hub: ReactorHub = None):
+        self.driver = driver
+        self.hub = hub or ReactorHub.default()
+        self.loop = None
 
         self.lock = threading.Lock()
         self.event = threading.Event()
-        self.daemon = True
         self.handlers = {}
+        # dispatch options per handler, see dispatch.Subscription
+        self.handler_options = {}
+        self.connection = None
+        # {session id: target id} of the attached pages
+        self.sessions = {}
+        # domains with handlers, in their original case ("DOMStorage")
+        self.domains = set()
+        # capture.ResponseCapture instances, attached to the connection
+        self.captures = []
+        self._wakeup = None
+        self._opening = None
+        self._queue = None
+        # runs the plain function handlers, created by listen()
+        self.executor = None
+        # events dropped because delivery fell max_pending events behind
+        self.dropped = 0
+        self._future = None
+        self.dispatcher = None
 
-    def add_event_handler(self, method_name, callback: callable):
+    def add_event_handler(self, method_name, callback: callable, **options):
         """
 
         Parameters
@@ -32,68 +177,274 @@ class Reactor(threading.Thread):
 
         callback: callable
             callable which accepts 1 parameter: the message object dictionary
+            (or a list of them, when batching)
+
+        options:
+            max_queue: int, default 1000
+                events queued for this handler at most
+            concurrency: int, default 1
+                calls of callback running at once
+            batch_size: int, default None
+                when set, callback receives lists of up to batch_size events
+            batch_timeout: float, default 0.05
+                seconds to wait for a batch to fill up
+            overflow: str, default "buffer"
+                what to do when the queue is full:
+                "buffer" holds events back until there is room (up to
+                max_queue more, dropping events beyond that with a
+                warning), without holding up the other handlers
+                "drop_oldest" discards the oldest queued event
+                "drop_newest" discards the new event
+
+        Raises
+        ------
+        ValueError
+            for unknown or invalid options
 
         Returns
         -------
 
         """
+        check_options(options)
+        if method_name == "*":
+            domains = WILDCARD_DOMAINS
+        else:
+            domains = [canonical_domain(method_name.split(".")[0])]
         with self.lock:
             self.handlers[method_name.lower()] = callback
+            self.handler_options[method_name.lower()] = options
+            new = set(domains) - self.domains
+            self.domains.update(new)
+        if new and self.connection is not None and self.loop is not None:
+            for domain in new:
+                for session_id in list(self.sessions):
+                    asyncio.run_coroutine_threadsafe(
+                        self._enable(domain, session_id), self.loop
+                    )
+
+    def add_capture(self, capture):
+        """
+        Attaches a capture.ResponseCapture to the browser's connection,
+        capturing the responses of all pages.
+        """
+        with self.lock:
+            self.captures.append(capture)
+            self.domains.add("Network")
+        if self.connection is not None and self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._attach(capture), self.loop)
+
+    async def _attach(self, capture):
+        try:
+            # the pages' sessions enable Network
+            await capture.attach(self.connection, enable=False)
+            for session_id in list(self.sessions):
+                await self._enable("Network", session_id)
+        except Exception as e:
+            logger.warning("could not start capturing responses: %s" % e)
+
+    @property
+    def stats(self):
+        """
+        Counters per handler: queue depth, drops, failures and latency (seconds).
+        """
+        if self.dispatcher is None:
+            return {}
+        return self.dispatcher.stats
 
     @property
     def running(self):
         return not self.event.is_set()
 
-    def run(self):
+    def start(self):
+        self.loop = self.hub.register(self)
+        self._future = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+
+    def stop(self):
+        self.event.set()
+        if self._wakeup is not None:
+            self.loop.call_soon_threadsafe(self._interrupt)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _interrupt(self):
+        self._wakeup.set()
+        # waiting for the browser to come back
+        if self._opening is not None:
+            self._opening.cancel()
+
+    def join(self, timeout=None):
+        if self._future is not None:
+            concurrent.futures.wait([self._future], timeout)
+
+    def is_alive(self):
+        return self._future is not None and not self._future.done()
+
+    async def _run(self):
         try:
-            asyncio.set_event_loop(self.loop)
-            self.loop.run_until_complete(self.listen())
+            await self.listen()
         except Exception as e:
             logger.warning("Reactor.run() => %s", e)
+        finally:
+            self.hub.unregister(self)
 
-    async def _wait_service_started(self):
-        while True:
-            with self.lock:
-                if (
-                    getattr(self.driver, "service", None)
-                    and getattr(self.driver.service, "process", None)
-                    and self.driver.service.process.poll()
-                ):
-                    await asyncio.sleep(self.driver._delay or 0.25)
-                else:
-                    break
+    async def _browser_url(self):
+        host, port = self.driver.options.debugger_address.split(":")
+        version = await readiness.wait_for_devtools_async(host, port)
+        return version["webSocketDebuggerUrl"]
 
-    async def listen(self):
-        while self.running:
-            await self._wait_service_started()
-            await asyncio.sleep(1)
+    async def _enable(self, domain, session_id):
+        try:
+            await self.connection.send("%s.enable" % domain, session_id=session_id)
+        except Exception as e:
+            logger.debug("could not enable %s: %s" % (domain, e))
 
-            try:
+    async def _open(self):
+        """
+        Connects to the browser, and attaches to its pages.
+        """
+        connection = Connection(await self._browser_url())
+        connection.add_listener("*", self._on_event)
+        # events without handlers are dropped before they are parsed
+        connection.event_filter = self._subscribed
+        connection.add_listener("Target.attachedToTarget", self._on_attached)
+        connection.add_listener("Target.detachedFromTarget", self._on_detached)
+        await connection.connect()
+        self.connection = connection
+        self.sessions = {}
+        with self.lock:
+            captures = list(self.captures)
+        for capture in captures:
+            await self._attach(capture)
+        try:
+            # pages opened later wait for their domains to be enabled
+            await connection.send(
+                "Target.setAutoAttach",
+                {"autoAttach": True, "waitForDebuggerOnStart": True, "flatten": True},
+            )
+        except CDPError as e:
+            # browsers without auto-attaching on the browser target
+            logger.debug("%s, discovering targets instead" % e)
+            connection.add_listener("Target.targetCreated", self._on_created)
+            await connection.send("Target.setDiscoverTargets", {"discover": True})
+
+    def _on_created(self, message):
+        target = message["params"]["targetInfo"]
+        if target.get("type") == "page":
+            asyncio.ensure_future(self._attach_target(target))
+
+    async def _attach_target(self, target):
+        try:
+            # attachedToTarget follows
+            await self.connection.send(
+                "Target.attachToTarget", {"targetId": target["targetId"], "flatten": True}
+            )
+        except (CDPError, ConnectionError, asyncio.TimeoutError) as e:
+            logger.debug("could not attach to %s: %s" % (target.get("url"), e))
+
+    def _on_attached(self, message):
+        params = message["params"]
+        asyncio.ensure_future(
+            self._setup_session(
+                params["sessionId"],
+                params["targetInfo"],
+                params.get("waitingForDebugger", False),
+            )
+        )
+
+    def _on_detached(self, message):
+        self.sessions.pop(message["params"].get("sessionId"), None)
+
+    async def _setup_session(self, session_id, target, waiting):
+        try:
+            if target.get("type") == "page":
+                self.sessions[session_id] = target.get("targetId")
                 with self.lock:
-                    log_entries = self.driver.get_log("performance")
+                    domains = list(self.domains)
+                for domain in domains:
+                    await self._enable(domain, session_id)
+        finally:
+            if waiting:
+                try:
+                    await self.connection.send(
+                        "Runtime.runIfWaitingForDebugger", session_id=session_id
+                    )
+                except (CDPError, ConnectionError, asyncio.TimeoutError) as e:
+                    logger.debug("could not resume %s: %s" % (target.get("url"), e))
 
-                for entry in log_entries:
+    async def listen(self):
+        self._wakeup = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if not self.running:
+            return
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix="uc-reactor"
+        )
+        self.dispatcher = Dispatcher(executor=self.executor)
+        delivery = asyncio.ensure_future(self._deliver())
+        failures = 0
+        try:
+            while self.running:
+                if self.connection is None or not self.connection.connected:
+                    if self.connection is not None:
+                        await self.connection.close()
+                        self.connection = None
+                    self._opening = asyncio.ensure_future(self._open())
                     try:
-                        obj_serialized: str = entry.get("message")
-                        obj = json.loads(obj_serialized)
-                        message = obj.get("message")
-                        method = message.get("method")
-
-                        if "*" in self.handlers:
-                            await self.loop.run_in_executor(
-                                None, self.handlers["*"], message
-                            )
-                        elif method.lower() in self.handlers:
-                            await self.loop.run_in_executor(
-                                None, self.handlers[method.lower()], message
-                            )
-
-                        # print(type(message), message)
-                    except Exception as e:
-                        raise e from None
-
-            except Exception as e:
-                if "invalid session id" in str(e):
+                        await self._opening
+                        failures = 0
+                    except asyncio.CancelledError:
+                        if self.running:
+                            raise
+                        break
+                    except (ConnectionError, OSError, CDPError, asyncio.TimeoutError) as e:
+                        # the browser might have been closed, or be restarting
+                        failures += 1
+                        log = logger.warning if failures == 1 else logger.debug
+                        log("cannot connect to the browser: %s" % e)
+                    finally:
+                        self._opening = None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), 1)
+                except asyncio.TimeoutError:
                     pass
-                else:
-                    logging.debug("exception ignored :", e)
+        finally:
+            delivery.cancel()
+            self.dispatcher.close()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            for capture in self.captures:
+                capture.detach()
+            if self.connection is not None:
+                await self.connection.close()
+
+    def _subscribed(self, method):
+        handlers = self.handlers
+        return "*" in handlers or method.lower() in handlers
+
+    def _on_event(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _deliver(self):
+        # hands the events, in the order they arrived, to the handlers' queues
+        while True:
+            message = await self._queue.get()
+            method = message.get("method", "")
+            with self.lock:
+                handlers = dict(self.handlers)
+                key = "*" if "*" in handlers else method.lower()
+                options = self.handler_options.get(key, {})
+            for stale in set(self.dispatcher.subscriptions) - set(handlers):
+                self.dispatcher.unsubscribe(stale)
+            handler = handlers.get(key)
+            if not handler:
+                continue
+            subscription = self.dispatcher.subscriptions.get(key)
+            if (
+                subscription is None
+                or subscription.callback is not handler
+                or subscription.options != options
+            ):
+                self.dispatcher.subscribe(key, handler, **options)
+            self.dispatcher.dispatch(key, message)
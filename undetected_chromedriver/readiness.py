@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Waiting for the browser and chromedriver to come up.
+
+Instead of sleeping for a worst-case delay, the DevTools /json/version endpoint
+of the browser and the /status endpoint of chromedriver are polled, with
+exponentially growing intervals, until they respond or a deadline passes.
+
+    wait_for_devtools("127.0.0.1", 9222, timeout=10)
+    wait_for_chromedriver(driver.service.service_url)
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from urllib.request import ProxyHandler
+from urllib.request import build_opener
+
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait, by default, before giving up
+DEFAULT_TIMEOUT = 10
+
+# local endpoints must never go through a proxy from the environment
+_opener = build_opener(ProxyHandler({}))
+
+
+def backoff(timeout, initial=0.01, factor=2.0, maximum=0.25):
+    """
+    Yields the intervals to sleep between attempts, growing from initial
+    up to maximum, until timeout seconds have passed. The last interval
+    is cut short to end at the deadline.
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield min(interval, remaining)
+        interval = min(interval * factor, maximum)
+
+
+def wait_until(predicate, timeout=DEFAULT_TIMEOUT, description=None, **kw):
+    """
+    Calls predicate until it returns something truthy, and returns that.
+
+    Args:
+        predicate: callable without arguments. exceptions count as "not ready"
+        timeout: seconds until TimeoutError is raised
+        description: what is waited for, used in messages
+        **kw: passed to backoff()
+    """
+    start = time.perf_counter()
+    intervals = backoff(timeout, **kw)
+    while True:
+        result = _attempt(predicate)
+        if result:
+            logger.debug(
+                "%s ready after %.3f seconds"
+                % (description or predicate, time.perf_counter() - start)
+            )
+            return result
+        try:
+            time.sleep(next(intervals))
+        except StopIteration:
+            raise TimeoutError(
+                "%s not ready after %.1f seconds" % (description or predicate, timeout)
+            ) from None
+
+
+async def wait_until_async(predicate, timeout=DEFAULT_TIMEOUT, description=None, **kw):
+    """
+    Like wait_until(), for use in a coroutine.
+    predicate can be a coroutine function. Otherwise it is run in the
+    default executor, since it usually does blocking io.
+    """
+    loop = asyncio.get_event_loop()
+    start = time.perf_counter()
+    intervals = backoff(timeout, **kw)
+    while True:
+        if asyncio.iscoroutinefunction(predicate):
+            try:
+                result = await predicate()
+            except Exception:
+                result = None
+        else:
+            result = await loop.run_in_executor(None, _attempt, predicate)
+        if result:
+            logger.debug(
+                "%s ready after %.3f seconds"
+                % (description or predicate, time.perf_counter() - start)
+            )
+            return result
+        try:
+            await asyncio.sleep(next(intervals))
+        except StopIteration:
+            raise TimeoutError(
+                "%s not ready after %.1f seconds" % (description or predicate, timeout)
+            ) from None
+
+
+def _attempt(predicate):
+    try:
+        return predicate()
+    except Exception:
+        return None
+
+
+def _get_json(url, timeout=1):
+    with _opener.open(url, timeout=timeout) as conn:
+        return json.loads(conn.read().decode("utf-8"))
+
+
+async def get_json_async(host, port, path, timeout=1):
+    """
+    GETs a json document from a local http endpoint, without blocking the event loop.
+    """
+
+    async def get():
+        reader, writer = await asyncio.open_connection(host, int(port))
+        try:
+            writer.write(
+                (
+                    "GET %s HTTP/1.1\r\nHost: %s:%s\r\nConnection: close\r\n\r\n"
+                    % (path, host, port)
+                ).encode()
+            )
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = head.split(b"\r\n", 1)[0].split()
+            if len(status) < 2 or status[1] != b"200":
+                raise OSError("GET %s returned %r" % (path, head[:64]))
+            length = re.search(rb"(?i)\r\ncontent-length:\s*(\d+)", head)
+            # the devtools server does not always close the connection
+            if length:
+                body = await reader.readexactly(int(length[1]))
+            else:
+                body = await reader.read()
+        finally:
+            writer.close()
+        return json.loads(body.decode("utf-8"))
+
+    return await asyncio.wait_for(get(), timeout)
+
+
+def devtools_version(host, port):
+    """
+    Returns the /json/version document of the browser, or None when it is not up (yet).
+    """
+    try:
+        return _get_json("http://%s:%s/json/version" % (host, port))
+    except (OSError, ValueError):
+        return None
+
+
+def chromedriver_ready(service_url):
+    """
+    Returns True when the chromedriver at service_url reports it is ready.
+    """
+    try:
+        status = _get_json(service_url.rstrip("/") + "/status")
+    except (OSError, ValueError):
+        return False
+    return bool(status.get("value", {}).get("ready"))
+
+
+def wait_for_devtools(host, port, timeout=DEFAULT_TIMEOUT):
+    """
+    Waits for the DevTools endpoint of the browser, and returns its /json/version document.
+    """
+    return wait_until(
+        lambda: devtools_version(host, port),
+        timeout=timeout,
+        description="devtools at %s:%s" % (host, port),
+    )
+
+
+def wait_for_chromedriver(service_url, timeout=DEFAULT_TIMEOUT):
+    """
+    Waits for chromedriver at service_url to report it is ready.
+    """
+    return wait_until(
+        lambda: chromedriver_ready(service_url),
+        timeout=timeout,
+        description="chromedriver at %s" % service_url,
+    )
+
+
+async def wait_for_devtools_async(host, port, timeout=DEFAULT_TIMEOUT):
+    """
+    Like wait_for_devtools(), for use in a coroutine.
+    """
+
+    async def version():
+        return await get_json_async(host, port, "/json/version")
+
+    return await wait_until_async(
+        version, timeout=timeout, description="devtools at %s:%s" % (host, port)
+    )
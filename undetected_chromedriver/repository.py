@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Sources for chromedriver release metadata and packages.
+
+Patcher asks a repository for documents (release metadata, like
+"last-known-good-versions-with-downloads.json" or "LATEST_RELEASE_114")
+and packages (like "120.0.6099.109/linux64/chromedriver-linux64.zip"),
+both addressed by a path relative to the repository root.
+
+    HTTPRepository      google's endpoints, or a mirror using the same layout
+    FileRepository      a local folder (or file:// url) using the same layout
+    MemoryRepository    documents and packages held in memory, for tests
+    FallbackRepository  tries several repositories in order
+
+The repository is chosen using Patcher(repository=...), or the UC_DRIVER_REPOSITORY
+environment variable holding one or more comma separated urls.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.parse import unquote
+from urllib.parse import urlparse
+from urllib.request import Request
+from urllib.request import urlopen
+from uuid import uuid4
+
+
+logger = logging.getLogger(__name__)
+
+
+def download_file(url, path, progress=None, chunk_size=1 << 16):
+    """
+    Streams url to path, verifying size and checksum while downloading.
+
+    Data is written to <path>.part first, and renamed to path once verified.
+    An existing .part file is resumed using a Range request.
+
+    Args:
+        url: source url
+        path: target file path
+        progress: None, or a callable accepting
+                  (bytes downloaded, total bytes or None, bytes per second)
+        chunk_size: bytes per read
+
+    Returns: path
+    """
+    part_path = path + ".part"
+    try:
+        offset = os.path.getsize(part_path)
+    except OSError:
+        offset = 0
+
+    headers = {"Range": "bytes=%d-" % offset} if offset else {}
+    try:
+        conn = urlopen(Request(url, headers=headers))
+    except HTTPError as e:
+        if e.code != 416:
+            raise
+        # range not satisfiable, the partial file is unusable
+        logger.debug("cannot resume %s, restarting download" % url)
+        os.unlink(part_path)
+        return download_file(url, path, progress, chunk_size)
+
+    with conn:
+        if offset and conn.status != 206:
+            logger.debug("server does not support resuming %s" % url)
+            offset = 0
+        length = conn.headers.get("Content-Length")
+        total = offset + int(length) if length is not None else None
+
+        # google storage sends "x-goog-hash: crc32c=...,md5=..." for the whole object
+        expected_md5 = None
+        for item in conn.headers.get_all("x-goog-hash") or ():
+            for value in item.split(","):
+                algo, _, digest = value.strip().partition("=")
+                if algo == "md5":
+                    expected_md5 = base64.b64decode(digest).hex()
+        md5 = hashlib.md5()
+
+        with io.open(part_path, "r+b" if offset else "wb") as fh:
+            if offset:
+                for chunk in iter(lambda: fh.read(chunk_size), b""):
+                    md5.update(chunk)
+                logger.debug("resuming download of %s at %d bytes" % (url, offset))
+            fh.seek(offset)
+            fh.truncate()
+            done = offset
+            start = time.perf_counter()
+            for chunk in iter(lambda: conn.read(chunk_size), b""):
+                fh.write(chunk)
+                md5.update(chunk)
+                done += len(chunk)
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress(done, total, (done - offset) / elapsed if elapsed else 0.0)
+
+    if total is not None and done != total:
+        # keep the partial file, so the next attempt resumes it
+        raise IOError("download of %s incomplete: %d of %d bytes" % (url, done, total))
+    if expected_md5 and md5.hexdigest() != expected_md5:
+        os.unlink(part_path)
+        raise IOError(
+            "checksum mismatch for %s: expected md5 %s, got %s"
+            % (url, expected_md5, md5.hexdigest())
+        )
+    os.replace(part_path, path)
+    return path
+
+
+class DriverRepository(object):
+    """
+    Base class for repositories, see the module docstring.
+    """
+
+    def get_document(self, path):
+        """
+        Returns the document at path, as str.
+        """
+        raise NotImplementedError
+
+    def download(self, path, target, progress=None):
+        """
+        Stores the package at path in the file target.
+
+        Args:
+            path: package path, relative to the repository root
+            target: file path to write to
+            progress: None, or a callable accepting
+                      (bytes downloaded, total bytes or None, bytes per second)
+
+        Returns: target
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "{0:s}()".format(self.__class__.__name__)
+
+
+class HTTPRepository(DriverRepository):
+    """
+    Repository served over http(s). Documents are cached on disk, see get_document.
+    """
+
+    # seconds a cached release-metadata response is used without asking the server
+    metadata_ttl = 3600
+    # when the cached response is older than metadata_ttl, return it right away
+    # and revalidate it in the background instead of blocking on the network
+    metadata_stale_while_revalidate = True
+
+    def __init__(self, url, download_url=None, cache_dir=None):
+        """
+        Args:
+            url: root url of the documents (and packages, if download_url is not given)
+            download_url: None = same as url
+                root url of the packages
+            cache_dir: None = do not cache
+                folder to cache documents in
+        """
+        self.url = url.rstrip("/")
+        self.download_url = (download_url or url).rstrip("/")
+        self.cache_dir = cache_dir
+
+    def get_document(self, path):
+        """
+        Gets a release-metadata document, through an on-disk cache.
+
+        Fresh entries (younger than metadata_ttl) are returned without network i/o.
+        Stale entries are revalidated using ETag / Last-Modified, in the background
+        if metadata_stale_while_revalidate is set. When the server cannot be reached,
+        a stale entry is used rather than failing.
+        """
+        url = "%s/%s" % (self.url, path.lstrip("/"))
+        if not self.cache_dir:
+            return self._revalidate_metadata(url, None, quiet=False)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = os.path.join(
+            self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".json"
+        )
+        try:
+            with io.open(cache_file, "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry:
+            age = time.time() - entry["fetched"]
+            if 0 <= age < self.metadata_ttl:
+                return entry["body"]
+            if self.metadata_stale_while_revalidate:
+                logger.debug("using stale metadata for %s, revalidating" % url)
+                threading.Thread(
+                    target=self._revalidate_metadata,
+                    args=(url, cache_file, entry),
+                    daemon=True,
+                ).start()
+                return entry["body"]
+        try:
+            return self._revalidate_metadata(url, cache_file, entry, quiet=False)
+        except (URLError, OSError) as e:
+            if not entry:
+                raise
+            logger.warning("could not refresh %s (%s), using cached metadata" % (url, e))
+            return entry["body"]
+
+    @staticmethod
+    def _revalidate_metadata(url, cache_file, entry=None, quiet=True):
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            with urlopen(Request(url, headers=headers)) as conn:
+                entry = {
+                    "url": url,
+                    "body": conn.read().decode(),
+                    "etag": conn.headers.get("ETag"),
+                    "last_modified": conn.headers.get("Last-Modified"),
+                }
+        except HTTPError as e:
+            if e.code != 304 or not entry:
+                if not quiet:
+                    raise
+                logger.debug("background revalidation of %s failed: %s" % (url, e))
+                return
+            logger.debug("metadata for %s not modified" % url)
+        except (URLError, OSError) as e:
+            if not quiet:
+                raise
+            logger.debug("background revalidation of %s failed: %s" % (url, e))
+            return
+        entry["fetched"] = time.time()
+        if not cache_file:
+            return entry["body"]
+        tmp_path = "%s.%s.tmp" % (cache_file, uuid4().hex)
+        try:
+            with io.open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(entry, fh)
+            os.replace(tmp_path, cache_file)
+        except OSError as e:
+            logger.debug("could not cache metadata for %s: %s" % (url, e))
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        return entry["body"]
+
+    def download(self, path, target, progress=None):
+        url = "%s/%s" % (self.download_url, path.lstrip("/"))
+        logger.debug("downloading from %s" % url)
+        return download_file(url, target, progress)
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(self.__class__.__name__, self.url)
+
+
+class FileRepository(DriverRepository):
+    """
+    Repository in a local (or network mounted) folder, which uses the same
+    layout as the http endpoints, for example:
+
+        <root>/last-known-good-versions-with-downloads.json
+        <root>/latest-versions-per-milestone-with-downloads.json
+        <root>/120.0.6099.109/linux64/chromedriver-linux64.zip
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: folder path, or file:// url
+        """
+        if root.startswith("file:"):
+            root = unquote(urlparse(root).path)
+            if os.name == "nt" and root.startswith("/"):
+                root = root[1:]
+        self.root = os.path.abspath(root)
+
+    def _path(self, path):
+        return os.path.join(self.root, *path.strip("/").split("/"))
+
+    def get_document(self, path):
+        with io.open(self._path(path), "r", encoding="utf-8") as fh:
+            return fh.read()
+
+    def download(self, path, target, progress=None):
+        source = self._path(path)
+        tmp_path = "%s.%s.tmp" % (target, uuid4().hex)
+        start = time.perf_counter()
+        try:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        if progress:
+            size = os.path.getsize(target)
+            elapsed = time.perf_counter() - start
+            progress(size, size, size / elapsed if elapsed else 0.0)
+        return target
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(self.__class__.__name__, self.root)
+
+
+class MemoryRepository(DriverRepository):
+    """
+    Repository held in memory, mainly useful as a fake in tests.
+
+        repo = MemoryRepository(
+            documents={"last-known-good-versions-with-downloads.json": "{...}"},
+            packages={"120.0.1/linux64/chromedriver-linux64.zip": zip_bytes},
+        )
+    """
+
+    def __init__(self, documents=None, packages=None):
+        self.documents = {k.strip("/"): v for k, v in (documents or {}).items()}
+        self.packages = {k.strip("/"): v for k, v in (packages or {}).items()}
+        # paths requested so far, in order
+        self.requests = []
+
+    def get_document(self, path):
+        self.requests.append(path)
+        try:
+            return self.documents[path.strip("/")]
+        except KeyError:
+            raise FileNotFoundError("no document %s" % path) from None
+
+    def download(self, path, target, progress=None):
+        self.requests.append(path)
+        try:
+            data = self.packages[path.strip("/")]
+        except KeyError:
+            raise FileNotFoundError("no package %s" % path) from None
+        with io.open(target, "wb") as fh:
+            fh.write(data)
+        if progress:
+            progress(len(data), len(data), 0.0)
+        return target
+
+
+class FallbackRepository(DriverRepository):
+    """
+    Tries each repository in order, until one succeeds.
+    """
+
+    def __init__(self, *repositories):
+        self.repositories = list(repositories)
+
+    def _first(self, method, *args):
+        error = None
+        for repository in self.repositories:
+            try:
+                return getattr(repository, method)(*args)
+            except (OSError, ValueError) as e:
+                logger.warning("%r failed (%s), trying next repository" % (repository, e))
+                error = e
+        if error is None:
+            raise FileNotFoundError("no repositories configured")
+        raise error
+
+    def get_document(self, path):
+        return self._first("get_document", path)
+
+    def download(self, path, target, progress=None):
+        return self._first("download", path, target, progress)
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(
+            self.__class__.__name__, ", ".join(map(repr, self.repositories))
+        )
+
+
+def repository_from_url(url, cache_dir=None):
+    """
+    Returns a FileRepository for file:// urls and plain paths,
+    a HTTPRepository for http(s) urls.
+    """
+    if url.startswith(("http://", "https://")):
+        return HTTPRepository(url, cache_dir=cache_dir)
+    return FileRepository(url)
+
+
+def repository_from_urls(urls, cache_dir=None):
+    """
+    Returns a repository for one or more urls (a list, or a comma separated str),
+    falling back to the next url when one fails.
+    """
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    repositories = [repository_from_url(u.strip(), cache_dir) for u in urls if u.strip()]
+    if len(repositories) == 1:
+        return repositories[0]
+    return FallbackRepository(*repositories)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+"""
+Background cleanup after Chrome.quit().
+
+quit() only signals the browser and chromedriver to stop. Waiting for the
+processes to exit, and removing the temporary profile (which can take a while
+for a profile with a big cache) is left to a worker thread, so the caller
+can continue right away.
+
+    TeardownService.default().flush()   # wait for outstanding cleanups
+"""
+
+import atexit
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+from .dprocess import pid_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+class TeardownService(object):
+    """
+    Runs cleanup tasks on a single worker thread, in the order they were submitted.
+
+    A task which raises is retried, with growing delays, up to `retries` times.
+    When `max_queue` tasks are pending, submit() blocks for up to `submit_timeout`
+    seconds, after which the task is run in the caller's thread instead of being lost.
+    """
+
+    max_queue = 64
+    submit_timeout = 5
+    retries = 5
+    retry_delay = 0.1
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, max_queue=None):
+        if max_queue is not None:
+            self.max_queue = max_queue
+        self._tasks = deque()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._thread = None
+        self._closed = False
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "retried": 0,
+            "inline": 0,
+        }
+
+    @classmethod
+    def default(cls):
+        """
+        The process wide service, which is flushed at interpreter exit.
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+                atexit.register(cls._default.close)
+            return cls._default
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._tasks) + self._running
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs) to be run on the worker.
+        """
+        task = (fn, args, kwargs)
+        with self._cond:
+            self.metrics["submitted"] += 1
+            if not self._closed:
+                queued = self._cond.wait_for(
+                    lambda: len(self._tasks) < self.max_queue, self.submit_timeout
+                )
+                if queued:
+                    self._tasks.append(task)
+                    self._ensure_worker()
+                    self._cond.notify_all()
+                    return
+            self.metrics["inline"] += 1
+        # closed (at exit), or the queue is full
+        self._run(task)
+
+    def flush(self, timeout=None):
+        """
+        Waits until all submitted tasks are done.
+        Returns False if timeout passed first.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._tasks and not self._running, timeout
+            )
+
+    def close(self, timeout=None):
+        """
+        Flushes, and runs tasks submitted afterwards in the caller's thread.
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._work, name="uc-teardown", daemon=True
+            )
+            self._thread.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._tasks or self._closed)
+                if not self._tasks:
+                    return
+                task = self._tasks.popleft()
+                self._running += 1
+                self._cond.notify_all()
+            try:
+                self._run(task)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def _run(self, task):
+        fn, args, kwargs = task
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.warning(
+                        "teardown task %s%r failed: %s"
+                        % (getattr(fn, "__name__", fn), args, e)
+                    )
+                    self._count("failed")
+                    return
+                logger.debug(
+                    "teardown task %s%r raised a %s: %s, retrying..."
+                    % (getattr(fn, "__name__", fn), args, e.__class__.__name__, e)
+                )
+                self._count("retried")
+                time.sleep(delay)
+                delay *= 2
+            else:
+                self._count("completed")
+                return
+
+    def _count(self, key):
+        with self._cond:
+            self.metrics[key] += 1
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(
+            self.__class__.__name__,
+            ", ".join("%s=%d" % kv for kv in self.metrics.items()),
+        )
+
+
+def reap_process(process, timeout=10):
+    """
+    Waits for a subprocess.Popen to exit, and kills it when it does not in time.
+    """
+    if process is None:
+        return
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait(timeout)
+
+
+def reap_pid(pid, timeout=10):
+    """
+    Waits for the process pid (which is not our child) to exit,
+    and kills it when it does not in time.
+    """
+    if not pid:
+        return
+    deadline = time.monotonic() + timeout
+    while pid_alive(pid):
+        if time.monotonic() > deadline:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            raise TimeoutError("process %d did not exit, killed it" % pid)
+        time.sleep(0.05)
+
+
+def remove_tree(path):
+    """
+    Removes the folder at path. A missing folder is not an error.
+    """
+    try:
+        shutil.rmtree(path)
+    except FileNotFoundError:
+        pass
+    else:
+        logger.debug("successfully removed %s" % path)
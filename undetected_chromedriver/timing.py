@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# this module is part of undetected_chromedriver
+
+from contextlib import contextmanager
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span(object):
+    """
+    A timed phase. start and end are time.perf_counter() values.
+    """
+
+    def __init__(self, name, start, end=None, **attrs):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.attrs = attrs
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def as_dict(self, origin=0.0):
+        d = {
+            "name": self.name,
+            "start": round(self.start - origin, 6),
+            "duration": None if self.end is None else round(self.duration, 6),
+        }
+        d.update(self.attrs)
+        return d
+
+    def __repr__(self):
+        return "{0:s}({1:s}, {2:s})".format(
+            self.__class__.__name__,
+            self.name,
+            "running" if self.end is None else "%.3fs" % self.duration,
+        )
+
+
+class StartupProfile(object):
+    """
+    Collects the timed phases of a browser startup.
+
+    Spans may be recorded from several threads, and may overlap. When the
+    startup is done, finish() hands the profile to the sink, if any.
+
+        profile = StartupProfile(sink=JSONLSink("startup.jsonl"))
+        with profile.span("browser_spawn"):
+            ...
+        profile.finish(browser_version="120.0.6099.109")
+        profile["browser_spawn"]  # => seconds
+    """
+
+    def __init__(self, sink=None):
+        """
+        Args:
+            sink: None, a callable accepting the finished profile,
+                  or a path to a jsonl file to append the profile to
+        """
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.attrs = {}
+        self.finished = False
+        self.sink = make_sink(sink)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the enclosed block as a span named name.
+        Attributes can be added to the yielded span while it runs.
+        """
+        span = Span(name, time.perf_counter(), **attrs)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._add(span)
+
+    def add(self, name, start, end=None, **attrs):
+        """
+        Records a span which was timed elsewhere. end defaults to now.
+        """
+        span = Span(name, start, time.perf_counter() if end is None else end, **attrs)
+        self._add(span)
+        return span
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+        logger.debug("startup phase %s took %.3f seconds" % (span.name, span.duration))
+
+    @property
+    def total(self):
+        """
+        Seconds from the creation of the profile to the end of the last span.
+        """
+        with self._lock:
+            ends = [s.end for s in self.spans if s.end is not None]
+        return max(ends) - self.origin if ends else 0.0
+
+    def __getitem__(self, name):
+        """
+        Returns the summed duration of the spans named name.
+        """
+        with self._lock:
+            durations = [s.duration for s in self.spans if s.name == name]
+        if not durations:
+            raise KeyError(name)
+        return sum(durations)
+
+    def __contains__(self, name):
+        with self._lock:
+            return any(s.name == name for s in self.spans)
+
+    def as_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        d = {
+            "started_at": self.started_at,
+            "total": round(self.total, 6),
+            "spans": [s.as_dict(self.origin) for s in spans],
+        }
+        d.update(self.attrs)
+        return d
+
+    def finish(self, **attrs):
+        """
+        Marks the startup as done, and sends the profile to the sink.
+        Errors raised by the sink are logged, not raised.
+        """
+        if self.finished:
+            return
+        self.attrs.update(attrs)
+        self.finished = True
+        logger.debug(
+            "startup took %.3f seconds: %s"
+            % (
+                self.total,
+                ", ".join("%s %.3f" % (s.name, s.duration) for s in self.spans),
+            )
+        )
+        if not self.sink:
+            return
+        try:
+            self.sink(self)
+        except Exception as e:
+            logger.warning("startup profile sink %r failed: %s" % (self.sink, e))
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(
+            self.__class__.__name__,
+            ", ".join("%s=%.3f" % (s.name, s.duration or 0) for s in self.spans),
+        )
+
+
+class JSONLSink(object):
+    """
+    Appends each profile as a line of json to a file.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+
+    def __call__(self, profile):
+        line = (json.dumps(profile.as_dict(), sort_keys=True) + "\n").encode("utf-8")
+        # a single write to a file opened for appending, so lines of
+        # concurrent processes do not interleave
+        with io.open(self.path, "ab") as fh:
+            fh.write(line)
+
+    def __repr__(self):
+        return "{0:s}({1:s})".format(self.__class__.__name__, self.path)
+
+
+def make_sink(sink):
+    """
+    Returns a callable sink for sink, which can be a callable, a path,
+    or None for the file in $UC_STARTUP_LOG, if set.
+    """
+    if sink is None:
+        sink = os.environ.get("UC_STARTUP_LOG") or None
+    if sink is None or callable(sink):
+        return sink
+    return JSONLSink(sink)
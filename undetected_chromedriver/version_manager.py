@@ -1,8 +1,12 @@
 import os
 import pathlib
+import shutil
 import subprocess
 import time
 
+from .collector import DriverCollector
+from .discovery import browser_version
+from .discovery import executable_version
 
 
 class VersionManager:
@@ -19,9 +23,8 @@ class VersionManager:
             os.makedirs(self.instances_path, exist_ok=True)
 
     def purge_redundant_drivers(self):
-        files = os.listdir(self.instances_path)
-        for _file in files:
-            os.remove(f"{self.instances_path}/{_file}")
+        # only instances of processes which are gone, others may still be in use
+        DriverCollector(instances_path=self.instances_path).collect_orphans()
 
     def version_file(self):
         path = os.path.join(str(pathlib.Path(__name__).parent.resolve()))
@@ -43,16 +46,13 @@ class VersionManager:
                 return version
 
     def get_installed_chrome_version(self):
-        try:
-            if os.getenv("USE_MAC_QUEUE") == "true":
-                print('Looking for Chrome version on Mac')
-                installed_version_bytes = subprocess.check_output(["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome", "--version"])
-            else:
-                installed_version_bytes = subprocess.check_output(["google-chrome", "--version"])
-            installed_version = installed_version_bytes.decode("UTF-8").split()[-1]
-            return installed_version
-        except Exception as e:
-            return False
+        if os.getenv("USE_MAC_QUEUE") == "true":
+            print('Looking for Chrome version on Mac')
+            path = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
+        else:
+            path = shutil.which("google-chrome")
+        # cached, so google-chrome only runs when it was installed or updated
+        return browser_version(path) or False
 
     def get_chromedriver_version(self):
         try:
@@ -60,10 +60,8 @@ class VersionManager:
             files.sort()
             if files:
                 first_instance = files[0]
-                cmd = [os.path.join(self.instances_path, first_instance), "--version"]
                 self.standard_path = os.path.join(self.instances_path, first_instance)
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                return result.stdout.split()[1]
+                return executable_version(self.standard_path) or False
             return False
         except (IndexError, PermissionError, FileNotFoundError):
             return False